@@ -2,6 +2,9 @@ import mongoose from "mongoose";
 import Exercise from "../models/exercise.model.js";
 import Trainee from "../models/trainee.model.js";
 
+// Upper bound on the rep timeline stored with one workout
+const MAX_REP_EVENTS = 2000;
+
 const fillMissingDays = (records, startDate, endDate) => {
   const recordsMap = {};
 
@@ -49,7 +52,7 @@ export const postWorkoutRecord = async (req, res, next) => {
   try {
     // console.log(req.body);
     
-    const { exercise, count, startTime, stopTime } = req.body;
+    const { exercise, count, startTime, stopTime, reps = [] } = req.body;
     const userId = req.user._id;    
 
     if (!userId) {
@@ -60,6 +63,10 @@ export const postWorkoutRecord = async (req, res, next) => {
       return res.status(400).json({message: "Invalid Inputs"});
     }
 
+    if (!Array.isArray(reps) || reps.length > MAX_REP_EVENTS) {
+      return res.status(400).json({message: "Invalid rep log"});
+    }
+
     // Convert startTime and stopTime to Date objects and calculate duration
     const start = new Date(startTime);
     const stop = new Date(stopTime);
@@ -70,7 +77,8 @@ export const postWorkoutRecord = async (req, res, next) => {
       count: count,
       duration: duration,
       date: Date.now(),
-      user: userId
+      user: userId,
+      reps: reps
     });
 
     await createRecord.save();
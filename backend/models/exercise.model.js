@@ -1,5 +1,18 @@
 import { Schema, model } from "mongoose";
 
+// One completed rep, as logged by the AI worker
+const repSchema = new Schema(
+  {
+    exercise: { type: String },
+    time: { type: Date },
+    duration: { type: Number }, // seconds
+    minAngle: { type: Number }, // range of the angle reps are counted on, in degrees
+    maxAngle: { type: Number },
+    postureFailures: { type: Number }, // analyzed frames where the posture check failed
+  },
+  { _id: false }
+);
+
 const exerciseSchema = new Schema(
   {
     name: { type: String, required: true },
@@ -7,6 +20,7 @@ const exerciseSchema = new Schema(
     duration: { type: Number, required: true }, // e.g., "5 min"
     date: { type: Date, default: Date.now },
     user: { type: Schema.Types.ObjectId, ref: "Trainee", required: true },
+    reps: { type: [repSchema], default: [] },
   },
   { timestamps: true }
 );
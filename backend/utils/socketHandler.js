@@ -1,12 +1,94 @@
 import { Server } from "socket.io";
 
-let pythonSocket = null;
-let activeWebRTCUser = null;
+// A worker that has not reported its load for this long gets no new sessions
+const WORKER_HEARTBEAT_TIMEOUT_MS = Number(process.env.WORKER_HEARTBEAT_TIMEOUT_MS || 15000);
+
+// Registered Python workers by socket id, with the load they last reported
+const pythonWorkers = new Map();
+// Socket id of the Python worker serving each user with a live WebRTC session
+const sessionWorkers = new Map();
+// Offers not answered yet, kept with the user's candidates so a rejected one can go to another worker
+const pendingOffers = new Map();
+// Worker of each ended session until it sends the session's rep log
+const closingSessions = new Map();
 const userSocketMap = new Map();
 
 export let io;
 export { userSocketMap };
 
+const updateWorker = (socket, status = {}) => {
+  const worker = pythonWorkers.get(socket.id) || { socket, workerId: socket.id, maxSessions: 1 };
+  for (const key of ["workerId", "maxSessions", "activeSessions", "queueDepth", "draining", "stages"]) {
+    if (status[key] !== undefined) worker[key] = status[key];
+  }
+  worker.lastSeen = Date.now();
+  pythonWorkers.set(socket.id, worker);
+  return worker;
+};
+
+const assignedSessions = (workerSocketId) => {
+  let count = 0;
+  for (const socketId of sessionWorkers.values()) {
+    if (socketId === workerSocketId) count++;
+  }
+  return count;
+};
+
+// The live, non-draining worker with the most spare capacity, skipping the ones in `exclude`
+const pickWorker = (exclude) => {
+  let best = null;
+  let bestLoad = Infinity;
+  for (const worker of pythonWorkers.values()) {
+    if (worker.draining || exclude.has(worker.socket.id)) continue;
+    if (Date.now() - worker.lastSeen > WORKER_HEARTBEAT_TIMEOUT_MS) continue;
+    // Sessions routed here since the last heartbeat are not in the worker's own count yet
+    const sessions = Math.max(worker.activeSessions || 0, assignedSessions(worker.socket.id));
+    if (sessions >= worker.maxSessions) continue;
+    const load = sessions / worker.maxSessions;
+    if (load < bestLoad || (load === bestLoad && (worker.queueDepth || 0) < (best.queueDepth || 0))) {
+      best = worker;
+      bestLoad = load;
+    }
+  }
+  return best;
+};
+
+const routeOffer = (userSocketId, pending) => {
+  const worker = pickWorker(pending.tried);
+  if (!worker) {
+    pendingOffers.delete(userSocketId);
+    sessionWorkers.delete(userSocketId);
+    if (pythonWorkers.size === 0) {
+      io.to(userSocketId).emit("python-disconnected");
+    } else {
+      io.to(userSocketId).emit("error-message", {
+        message: pending.message || "AI processor is currently busy. Please try again in a moment.",
+      });
+    }
+    return;
+  }
+
+  pending.tried.add(worker.socket.id);
+  pendingOffers.set(userSocketId, pending);
+  sessionWorkers.set(userSocketId, worker.socket.id);
+  console.log(`WebRTC session for user ${userSocketId} routed to worker ${worker.workerId}`);
+  worker.socket.emit("webrtc-offer", { ...pending.offer, from: userSocketId });
+  for (const candidate of pending.candidates) {
+    worker.socket.emit("ice-candidate", { ...candidate, from: userSocketId });
+  }
+};
+
+// Tells the user's worker the session is over and forgets it
+const endSession = (userSocketId) => {
+  const worker = pythonWorkers.get(sessionWorkers.get(userSocketId));
+  if (worker) {
+    worker.socket.emit("client-disconnected", { from: userSocketId });
+    closingSessions.set(userSocketId, worker.socket.id);
+  }
+  sessionWorkers.delete(userSocketId);
+  pendingOffers.delete(userSocketId);
+};
+
 export const initializeSocketIO = (httpServer) => {
   io = new Server(httpServer, {
     cors: {
@@ -25,69 +107,126 @@ export const initializeSocketIO = (httpServer) => {
       io.emit("getOnlineUsers", Array.from(userSocketMap.keys()));
     }
 
-    socket.on("connect-python", () => {
-      pythonSocket = socket;
+    // PYTHON WORKERS
+    // Each worker registers with its id, session limit and current load, then
+    // sends the same status as a heartbeat. A draining worker keeps its live
+    // sessions but gets no new ones.
+    socket.on("connect-python", (status) => {
+      const worker = updateWorker(socket, status);
       console.log(
-        `Python WebRTC server connected! Socket ID: ${pythonSocket.id}`
+        `Python worker ${worker.workerId} registered (${worker.maxSessions} sessions). Socket ID: ${socket.id}`
       );
     });
 
+    socket.on("worker-heartbeat", (status) => {
+      if (pythonWorkers.has(socket.id)) updateWorker(socket, status);
+    });
+
+    socket.on("worker-draining", (status) => {
+      if (!pythonWorkers.has(socket.id)) return;
+      const worker = updateWorker(socket, { ...status, draining: true });
+      console.log(`Python worker ${worker.workerId} is draining (${worker.activeSessions} sessions left).`);
+    });
+
     // WEBRTC SIGNALING LOGIC
+    // Messages to Python carry the user's socket id in `from`; messages from
+    // Python carry the target user's socket id in `to`, and are only relayed
+    // from the worker serving that user.
+    const isWorkerFor = (to) => sessionWorkers.get(to) === socket.id;
+
     socket.on("webrtc-offer", (data) => {
-      if (!pythonSocket) {
+      if (pythonWorkers.size === 0) {
         return socket.emit("python-disconnected");
       }
-      if (activeWebRTCUser) {
-        // Refactored: Notify user that the server is busy
-        return socket.emit("error-message", {
-          message:
-            "AI processor is currently busy. Please try again in a moment.",
-        });
+
+      // A new offer from a user with a live session replaces it on the same worker
+      const current = pythonWorkers.get(sessionWorkers.get(socket.id));
+      const tried = new Set();
+      if (current && !current.draining) {
+        pendingOffers.set(socket.id, { offer: data, candidates: [], tried: tried.add(current.socket.id) });
+        current.socket.emit("webrtc-offer", { ...data, from: socket.id });
+        return;
       }
+      if (current) endSession(socket.id);
+      routeOffer(socket.id, { offer: data, candidates: [], tried });
+    });
 
-      // Lock the session to this user
-      activeWebRTCUser = { socketId: socket.id };
-      console.log(`WebRTC session started for user ${socket.id}`);
-      pythonSocket.emit("webrtc-offer", { ...data, from: socket.id });
+    socket.on("session-rejected", ({ to, message, retry }) => {
+      if (!isWorkerFor(to)) return;
+      const pending = pendingOffers.get(to);
+      sessionWorkers.delete(to);
+      if (retry && pending) {
+        return routeOffer(to, { ...pending, message });
+      }
+      pendingOffers.delete(to);
+      io.to(to).emit("error-message", {
+        message: message || "AI processor is currently busy. Please try again in a moment.",
+      });
     });
 
-    socket.on("webrtc-answer", (data) => {
-      if (activeWebRTCUser) {
-        io.to(activeWebRTCUser.socketId).emit("webrtc-answer", data);
+    socket.on("webrtc-answer", ({ to, ...data }) => {
+      if (isWorkerFor(to)) {
+        pendingOffers.delete(to);
+        io.to(to).emit("webrtc-answer", data);
       } else {
         console.warn(
-          "Received answer from Python, but no active user session."
+          `Received answer from Python, but no active session for ${to}.`
         );
       }
     });
 
     socket.on("ice-candidate", (data) => {
-      if (socket.id === pythonSocket?.id && activeWebRTCUser) {
-        io.to(activeWebRTCUser.socketId).emit("ice-candidate", data);
-      } else if (socket.id === activeWebRTCUser?.socketId && pythonSocket) {
-        pythonSocket.emit("ice-candidate", data);
+      if (pythonWorkers.has(socket.id)) {
+        const { to, ...candidate } = data;
+        if (isWorkerFor(to)) {
+          io.to(to).emit("ice-candidate", candidate);
+        }
+      } else if (sessionWorkers.has(socket.id)) {
+        pendingOffers.get(socket.id)?.candidates.push(data);
+        pythonWorkers.get(sessionWorkers.get(socket.id))?.socket.emit("ice-candidate", { ...data, from: socket.id });
+      }
+    });
+
+    socket.on("exercise-feedback", ({ to, ...data }) => {
+      if (isWorkerFor(to)) {
+        io.to(to).emit("exercise-feedback", data);
       }
     });
 
-    socket.on("exercise-feedback", (data) => {
-      if (activeWebRTCUser) {
-        io.to(activeWebRTCUser.socketId).emit("exercise-feedback", data);
+    socket.on("exercise-recognized", ({ to, ...data }) => {
+      if (isWorkerFor(to)) {
+        io.to(to).emit("exercise-recognized", data);
+      }
+    });
+
+    // The worker closed an abandoned session; its rep log follows
+    socket.on("session-idle", ({ to, ...data }) => {
+      if (!isWorkerFor(to)) return;
+      sessionWorkers.delete(to);
+      pendingOffers.delete(to);
+      closingSessions.set(to, socket.id);
+      io.to(to).emit("session-idle", data);
+    });
+
+    // Sent once per session as it closes, usually after the user stopped it
+    socket.on("rep-log", ({ to, ...data }) => {
+      if (isWorkerFor(to) || closingSessions.get(to) === socket.id) {
+        closingSessions.delete(to);
+        io.to(to).emit("rep-log", data);
       }
     });
 
     socket.on("exercise-change", (data) => {
-      if (pythonSocket && socket.id === activeWebRTCUser?.socketId) {
-        pythonSocket.emit("exercise-change", data);
+      const worker = pythonWorkers.get(sessionWorkers.get(socket.id));
+      if (worker) {
+        worker.socket.emit("exercise-change", { ...data, from: socket.id });
       }
     });
 
     socket.on("stop-webrtc-session", () => {
-      if (socket.id === activeWebRTCUser?.socketId) {
+      if (sessionWorkers.has(socket.id)) {
         console.log(`User ${socket.id} stopped the WebRTC session.`);
-        if (pythonSocket) {
-          pythonSocket.emit("client-disconnected");
-        }
-        activeWebRTCUser = null;
+        endSession(socket.id);
       }
     });
 
@@ -95,21 +234,26 @@ export const initializeSocketIO = (httpServer) => {
       console.log(`Client disconnected: ${socket.id}`);
 
       // WebRTC disconnect
-      if (socket.id === activeWebRTCUser?.socketId) {
-        console.log(`WebRTC user ${socket.id} disconnected. Releasing lock.`);
-        if (pythonSocket) {
-          pythonSocket.emit("client-disconnected"); // Notify Python
-        }
-        activeWebRTCUser = null;
+      if (sessionWorkers.has(socket.id)) {
+        console.log(`WebRTC user ${socket.id} disconnected. Ending session.`);
+        endSession(socket.id); // Notify Python
       }
+      closingSessions.delete(socket.id);
 
-      // Python server disconnect
-      if (socket.id === pythonSocket?.id) {
-        console.log("Python WebRTC server disconnected!");
-        pythonSocket = null;
-        if (activeWebRTCUser) {
-          io.to(activeWebRTCUser.socketId).emit("python-disconnected");
-          activeWebRTCUser = null; // Also release lock
+      // Python worker disconnect: only its own users lose their session
+      const worker = pythonWorkers.get(socket.id);
+      if (worker) {
+        console.log(`Python worker ${worker.workerId} disconnected!`);
+        pythonWorkers.delete(socket.id);
+        for (const [userSocketId, workerSocketId] of sessionWorkers) {
+          if (workerSocketId === socket.id) {
+            io.to(userSocketId).emit("python-disconnected");
+            sessionWorkers.delete(userSocketId);
+            pendingOffers.delete(userSocketId);
+          }
+        }
+        for (const [userSocketId, workerSocketId] of closingSessions) {
+          if (workerSocketId === socket.id) closingSessions.delete(userSocketId);
         }
       }
 
@@ -0,0 +1,203 @@
+"""
+Offline exercise analysis for recorded videos.
+
+    python batch_analyze.py uploads/ form_check.mp4 --exercise squat --output results --workers 4
+
+Every input video becomes one output file with a row per frame: landmarks,
+joint angles, position, rep count and whether a rep was completed on that
+frame. Files are spread over a process pool with one pose model per worker.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import av
+import numpy as np
+
+from landmarks import NUM_LANDMARKS, SHOULDER, ELBOW, WRIST, HIP, KNEE, ANKLE, side_triplets, joint_angles
+from pose_estimation import InferenceRegion, estimate_pose
+from pose_pool import PoseEstimatorPool
+from pose_backends import BACKENDS, default_backend
+from processors import PROCESSORS, get_processor_class, get_exercise_processor
+from smoothing import LANDMARK_SMOOTHING, LandmarkSmoother
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".webm", ".mkv", ".avi", ".m4v"}
+
+# Angles written for every frame, whatever the exercise
+ANGLE_NAMES = ["Elbow", "Shoulder", "Hip", "Knee"]
+REPORT_ANGLES = side_triplets(
+    (SHOULDER, ELBOW, WRIST), (HIP, SHOULDER, ELBOW), (SHOULDER, HIP, KNEE), (HIP, KNEE, ANKLE)
+)
+
+_pose_pool = None
+
+
+def find_videos(paths):
+    videos = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            videos.extend(sorted(p for p in path.rglob("*") if p.suffix.lower() in VIDEO_EXTENSIONS))
+        elif path.is_file():
+            videos.append(path)
+        else:
+            print(f"Skipping {path}: not found.")
+    return videos
+
+
+def _init_worker(pose_backend):
+    global _pose_pool
+    _pose_pool = PoseEstimatorPool(pose_backend)
+
+
+def analyze_video(path, exercise_type):
+    """Runs pose estimation and the exercise analyzer over every frame of a video."""
+    started = time.perf_counter()
+    processor = get_exercise_processor(exercise_type)
+    pose = _pose_pool.checkout(**get_processor_class(exercise_type).POSE_OPTIONS)
+
+    region = InferenceRegion()
+    smoother = LandmarkSmoother() if LANDMARK_SMOOTHING else None
+    times, analyses, rows = [], [], []
+    try:
+        with av.open(str(path)) as container:
+            stream = container.streams.video[0]
+            fps = float(stream.average_rate or 30)
+            for index, frame in enumerate(container.decode(stream)):
+                # Frames without a timestamp are timed by their position instead
+                frame_time = frame.time if frame.time is not None else index / fps
+                landmarks = estimate_pose(pose, frame.to_ndarray(format="rgb24"), region=region)
+                if smoother is not None:
+                    landmarks = smoother(landmarks, frame_time)
+                analyses.append(processor.analyze_exercise(landmarks, frame_time))
+                times.append(frame_time)
+                rows.append(landmarks)
+    finally:
+        # Returning the pose resets tracking for the next file
+        _pose_pool.checkin(pose)
+
+    # Frames without a person stay NaN so the whole file runs through one angle call
+    landmarks = np.full((len(rows), NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    for index, row in enumerate(rows):
+        if row is not None:
+            landmarks[index] = row
+    angles = joint_angles(landmarks, REPORT_ANGLES)
+
+    return {
+        "path": str(path),
+        "times": times,
+        "landmarks": landmarks,
+        "angles": angles,
+        "analyses": analyses,
+        "worker": os.getpid(),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def to_records(result):
+    previous_reps = 0
+    for index, analysis in enumerate(result["analyses"]):
+        rep_count = analysis["repCount"]
+        landmarks = result["landmarks"][index]
+        record = {
+            "frame": index,
+            "time": result["times"][index],
+            "landmarks": None if np.isnan(landmarks[0, 0]) else landmarks.round(5).tolist(),
+            "position": analysis["position"],
+            "repCount": rep_count,
+            "repEvent": rep_count > previous_reps,
+        }
+        for side, side_name in enumerate(("left", "right")):
+            for column, angle_name in enumerate(ANGLE_NAMES):
+                angle = result["angles"][index, side, column]
+                record[f"{side_name}{angle_name}Angle"] = None if np.isnan(angle) else round(float(angle), 2)
+        previous_reps = rep_count
+        yield record
+
+
+def write_jsonl(records, destination):
+    with open(destination, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def write_parquet(records, destination):
+    pa = _import_pyarrow()
+    pa.parquet.write_table(pa.Table.from_pylist(list(records)), destination)
+
+
+WRITERS = {"jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze recorded exercise videos offline.")
+    parser.add_argument("inputs", nargs="+", help="Video files or directories to scan recursively")
+    parser.add_argument("--exercise", default="pushup", choices=sorted(PROCESSORS))
+    parser.add_argument("--output", default="analysis", help="Directory for the per-video results")
+    parser.add_argument("--format", default="jsonl", choices=sorted(WRITERS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pose-backend", default=default_backend(), choices=sorted(BACKENDS))
+    args = parser.parse_args()
+    if args.format == "parquet":
+        _import_pyarrow()
+
+    videos = find_videos(args.inputs)
+    if not videos:
+        raise SystemExit("No videos found.")
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    worker_frames, worker_seconds = {}, {}
+    used_names = set()
+    started = time.perf_counter()
+    # MediaPipe does not survive fork(), so workers are spawned
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(args.pose_backend,)) as pool:
+        futures = {pool.submit(analyze_video, video, args.exercise): video for video in videos}
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Failed to analyze {video}: {e}")
+                continue
+
+            frames = len(result["analyses"])
+            # Videos with the same name in different folders must not overwrite each other
+            name, suffix = video.stem, 1
+            while name in used_names:
+                suffix += 1
+                name = f"{video.stem}_{suffix}"
+            used_names.add(name)
+            destination = output_dir / f"{name}.{args.format}"
+            WRITERS[args.format](to_records(result), destination)
+
+            worker = result["worker"]
+            worker_frames[worker] = worker_frames.get(worker, 0) + frames
+            worker_seconds[worker] = worker_seconds.get(worker, 0.0) + result["seconds"]
+            reps = result["analyses"][-1]["repCount"] if frames else 0
+            print(f"{video}: {frames} frames, {reps} reps, "
+                  f"{frames / max(result['seconds'], 1e-9):.1f} fps -> {destination}")
+
+    elapsed = time.perf_counter() - started
+    for worker, frames in sorted(worker_frames.items()):
+        print(f"Worker {worker}: {frames} frames at {frames / max(worker_seconds[worker], 1e-9):.1f} fps")
+    total_frames = sum(worker_frames.values())
+    print(f"Total: {total_frames} frames from {len(videos)} videos in {elapsed:.1f}s "
+          f"({total_frames / max(elapsed, 1e-9):.1f} fps overall)")
+
+
+if __name__ == "__main__":
+    main()
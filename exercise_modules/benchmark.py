@@ -0,0 +1,257 @@
+"""
+Per-stage latency benchmarks for the exercise pipeline.
+
+    python benchmark.py --resolutions 640x480,1280x720 --output bench.json
+    python benchmark.py --stages analyze --landmarks analysis/squat_demo.jsonl
+    python benchmark.py --stages pose --video squat.mp4 \
+        --pose-backends mediapipe-heavy,mediapipe-lite,movenet-tflite --reference-backend mediapipe-heavy
+
+Stages: "pose" (estimate_pose), "draw" (draw_landmarks), "frame" (the
+decode to RGB in VideoProcessTrack, whose array is drawn on and sent back
+as the outgoing frame) and "analyze"
+(analyze_exercise for each processor). The analyze stage replays landmark
+sequences, either recorded by batch_analyze.py or generated from --seed, so it
+runs without MediaPipe, OpenCV or PyAV installed.
+
+The pose stage runs once per backend in --pose-backends. Every backend other
+than the reference is also scored against the reference's landmarks on the
+same frames, so latency can be weighed against accuracy; use a --video with
+a person in it for the scores to mean anything.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from landmarks import NUM_LANDMARKS, SIDE_INDEX, X, Y, VISIBILITY
+from processors import PROCESSORS, get_exercise_processor
+
+STAGES = ("pose", "draw", "frame", "analyze")
+
+
+def summarize(samples):
+    samples = np.asarray(samples)
+    mean = samples.mean()
+    return {
+        "samples": int(samples.size),
+        "meanMs": round(mean * 1e3, 4),
+        "p50Ms": round(np.percentile(samples, 50) * 1e3, 4),
+        "p95Ms": round(np.percentile(samples, 95) * 1e3, 4),
+        "p99Ms": round(np.percentile(samples, 99) * 1e3, 4),
+        "throughputPerSec": round(1.0 / mean, 2) if mean > 0 else None,
+    }
+
+
+def time_calls(fn, inputs, warmup):
+    for item in inputs[:warmup]:
+        fn(item)
+    samples = []
+    for item in inputs:
+        started = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def synthetic_landmarks(rng, count):
+    """A smooth random walk of plausible, fully visible landmarks."""
+    steps = rng.normal(0.0, 0.01, size=(count, NUM_LANDMARKS, 4)).astype(np.float32)
+    sequence = np.clip(rng.random((NUM_LANDMARKS, 4), dtype=np.float32) + np.cumsum(steps, axis=0), 0.0, 1.0)
+    sequence[:, :, VISIBILITY] = 0.9
+    return sequence
+
+
+def load_landmarks(path):
+    """Landmark rows from a batch_analyze.py JSON Lines file; frames without a person are None."""
+    sequence = []
+    with open(path) as f:
+        for line in f:
+            landmarks = json.loads(line).get("landmarks")
+            sequence.append(None if landmarks is None else np.asarray(landmarks, dtype=np.float32))
+    return sequence
+
+
+def synthetic_frames(rng, width, height, count):
+    return [rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def video_frames(path, width, height, count):
+    import av
+    import cv2
+
+    frames = []
+    with av.open(path) as container:
+        for frame in container.decode(video=0):
+            frames.append(cv2.resize(frame.to_ndarray(format="rgb24"), (width, height)))
+            if len(frames) == count:
+                break
+    return frames
+
+
+def bench_pose(images, warmup, backend):
+    """Latency samples of one pose backend, and its landmarks for each image."""
+    from pose_estimation import estimate_pose
+    from pose_pool import PoseEstimatorPool
+
+    pool = PoseEstimatorPool(backend)
+    pose = pool.checkout(**PROCESSORS["pushup"].POSE_OPTIONS)
+    outputs = []
+    try:
+        samples = time_calls(lambda image: outputs.append(estimate_pose(pose, image)), images, warmup)
+    finally:
+        pool.checkin(pose)
+        pool.close()
+    return samples, outputs[-len(images):]
+
+
+def pose_accuracy(estimates, references, threshold=0.05):
+    """
+    Agreement with a reference backend over the body joints the exercises
+    use: how often both find a person, the mean joint distance where both do
+    (in frame-normalized units), and the fraction of joints within
+    `threshold` of the reference (PCK).
+    """
+    joints = SIDE_INDEX.ravel()
+    detected = [(estimate, reference) for estimate, reference in zip(estimates, references)
+                if estimate is not None and reference is not None]
+    agreement = np.mean([(estimate is None) == (reference is None)
+                         for estimate, reference in zip(estimates, references)])
+    result = {"frames": len(references), "bothDetected": len(detected),
+              "detectionAgreement": round(float(agreement), 4)}
+    if detected:
+        estimate = np.stack([pair[0][joints] for pair in detected])
+        reference = np.stack([pair[1][joints] for pair in detected])
+        visible = reference[..., VISIBILITY] > 0.5
+        errors = np.hypot(estimate[..., X] - reference[..., X], estimate[..., Y] - reference[..., Y])[visible]
+        if errors.size:
+            result["meanJointError"] = round(float(errors.mean()), 5)
+            result[f"pck{int(threshold * 100):02d}"] = round(float((errors < threshold).mean()), 4)
+    return result
+
+
+def bench_draw(images, landmark_sequence, warmup):
+    from pose_estimation import draw_landmarks
+
+    pairs = [(image.copy(), landmark_sequence[i % len(landmark_sequence)]) for i, image in enumerate(images)]
+    return time_calls(lambda pair: draw_landmarks(*pair), pairs, warmup)
+
+
+def bench_frame(images, landmark_sequence, warmup):
+    from av import VideoFrame
+
+    frames = [VideoFrame.from_ndarray(image, format="rgb24").reformat(format="yuv420p") for image in images]
+
+    def round_trip(frame):
+        frame.reformat(format="rgb24").to_ndarray()
+
+    return time_calls(round_trip, frames, warmup)
+
+
+IMAGE_STAGES = {"draw": bench_draw, "frame": bench_frame}
+
+
+def bench_analyze(landmark_sequence, warmup):
+    results = {}
+    for name in sorted(PROCESSORS):
+        processor = get_exercise_processor(name)
+        samples = time_calls(processor.analyze_exercise, landmark_sequence, warmup)
+        results[name] = summarize(samples)
+    return results
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the exercise pipeline stages.")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--resolutions", default="320x240,640x480,1280x720")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed calls per stage and resolution")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--video", help="Take image frames from this video instead of random noise")
+    parser.add_argument("--landmarks", help="Replay landmarks from a batch_analyze.py JSON Lines file")
+    parser.add_argument("--pose-backends", help="Comma-separated backends for the pose stage (default: POSE_BACKEND)")
+    parser.add_argument("--reference-backend", help="Backend the others are scored against (default: the first one)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    backends = []
+    if "pose" in stages:
+        from pose_backends import default_backend
+
+        backends = [name.strip() for name in (args.pose_backends or default_backend()).split(",") if name.strip()]
+        reference = args.reference_backend or backends[0]
+        # The reference runs first so each other backend can be scored as soon as it is timed
+        backends = [reference] + [name for name in backends if name != reference]
+
+    rng = np.random.default_rng(args.seed)
+    if args.landmarks:
+        landmark_sequence = load_landmarks(args.landmarks)
+    else:
+        landmark_sequence = list(synthetic_landmarks(rng, args.iterations))
+
+    report = {
+        "config": {
+            "stages": stages,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "video": args.video,
+            "landmarks": args.landmarks,
+            "poseBackends": backends,
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": [],
+    }
+
+    if "analyze" in stages:
+        for processor, stats in bench_analyze(landmark_sequence, args.warmup).items():
+            report["results"].append({"stage": "analyze", "processor": processor, **stats})
+
+    image_stages = [stage for stage in stages if stage in IMAGE_STAGES or stage == "pose"]
+    for resolution in (args.resolutions.split(",") if image_stages else []):
+        width, height = parse_resolution(resolution)
+        if args.video:
+            images = video_frames(args.video, width, height, args.iterations)
+        else:
+            images = synthetic_frames(rng, width, height, args.iterations)
+        for stage in image_stages:
+            if stage != "pose":
+                stats = summarize(IMAGE_STAGES[stage](images, landmark_sequence, args.warmup))
+                report["results"].append({"stage": stage, "resolution": f"{width}x{height}", **stats})
+                continue
+            reference_landmarks = None
+            for backend in backends:
+                samples, estimates = bench_pose(images, args.warmup, backend)
+                result = {"stage": "pose", "backend": backend, "resolution": f"{width}x{height}", **summarize(samples)}
+                if reference_landmarks is None:
+                    reference_landmarks = estimates
+                else:
+                    result["accuracy"] = pose_accuracy(estimates, reference_landmarks)
+                report["results"].append(result)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
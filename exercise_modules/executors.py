@@ -0,0 +1,523 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from processors import get_exercise_processor, get_processor_class, pose_option_sets
+from pose_pool import PoseEstimatorPool
+from pose_backends import BATCH_BACKENDS, session_backends
+from pose_estimation import InferenceRegion, estimate_pose, finish_inference, prepare_inference
+from metrics import BATCH_SIZE_BUCKETS, Histogram, StageTimer
+from smoothing import LANDMARK_SMOOTHING, LandmarkSmoother
+
+# Longest a frame waits for frames of other sessions to join its batch, in milliseconds
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "10"))
+# Most frames run through the pose model in one call
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+# The MoveNet backends ignore the confidence settings, so sessions share estimators built with these
+BATCH_POSE_OPTIONS = {"min_detection_confidence": 0.5, "min_tracking_confidence": 0.5}
+
+
+def analyze_frame(pose, processor, image: np.ndarray, region: Optional[InferenceRegion] = None,
+                  smoother: Optional[LandmarkSmoother] = None,
+                  timestamp: Optional[float] = None) -> Tuple[Dict, Optional[np.ndarray], StageTimer]:
+    """
+    Runs pose estimation and exercise analysis for a single RGB frame. Returns
+    the analysis, the landmarks for the caller to draw on its own copy of the
+    frame, and the timer with the time spent in each stage and the bytes
+    copied. The image is only read, so worker processes never send it back.
+    Landmarks are smoothed and reps timed against the frame's `timestamp`.
+    """
+    timer = StageTimer()
+    if timestamp is None:
+        timestamp = time.perf_counter()
+    landmarks = estimate_pose(pose, image, timer, region)
+    if smoother is not None:
+        landmarks = smoother(landmarks, timestamp)
+        timer.lap("smoothing")
+    analysis = processor.analyze_exercise(landmarks, timestamp)
+    timer.lap("analysis")
+    return analysis, landmarks, timer
+
+
+def _worker_id() -> str:
+    return f"pid-{os.getpid()}/{threading.current_thread().name}"
+
+def _timed_call(fn, *args):
+    # Runs inside the worker so the measured time excludes queueing and pickling.
+    started = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - started
+    return _worker_id(), elapsed, result
+
+
+# Per-process state, only used inside ProcessPoolExecutor workers.
+_worker_pose_pool = None
+_worker_sessions = {}
+
+def _worker_init(warm_up_count: int):
+    global _worker_pose_pool
+    _worker_pose_pool = PoseEstimatorPool()
+    for backend in session_backends():
+        for options in pose_option_sets():
+            _worker_pose_pool.warm_up(**options, count=warm_up_count, backend=backend)
+
+def _create_smoother() -> Optional[LandmarkSmoother]:
+    return LandmarkSmoother() if LANDMARK_SMOOTHING else None
+
+def _worker_open_session(session_id: str, exercise_type: str, pose_backend: Optional[str]):
+    pose = _worker_pose_pool.checkout(**get_processor_class(exercise_type).POSE_OPTIONS, backend=pose_backend)
+    _worker_sessions[session_id] = [
+        exercise_type, pose, get_exercise_processor(exercise_type), InferenceRegion(), _create_smoother()
+    ]
+
+def _worker_analyze_frame(session_id: str, exercise_type: str, pose_backend: Optional[str], image: np.ndarray,
+                          timestamp: Optional[float]):
+    entry = _worker_sessions.get(session_id)
+    if entry is None:
+        _worker_open_session(session_id, exercise_type, pose_backend)
+        entry = _worker_sessions[session_id]
+    elif entry[0] != exercise_type:
+        # Keep the pose graph and its tracking state, only swap the rep counting
+        entry[0], entry[2] = exercise_type, get_exercise_processor(exercise_type)
+    return analyze_frame(entry[1], entry[2], image, entry[3], entry[4], timestamp)
+
+def _worker_release_session(session_id: str):
+    entry = _worker_sessions.pop(session_id, None)
+    if entry is not None:
+        _worker_pose_pool.checkin(entry[1])
+
+def _worker_noop():
+    pass
+
+def _worker_probe(count: int) -> Dict[str, List[float]]:
+    return _probe_backends(_worker_pose_pool, count)
+
+def _probe_backends(pool: PoseEstimatorPool, count: int) -> Dict[str, List[float]]:
+    """Inference times of every session backend, on an estimator with the first exercise's settings."""
+    options = pose_option_sets()[0]
+    return {backend: pool.probe(**options, count=count, backend=backend) for backend in session_backends()}
+
+
+class InferenceExecutor:
+    """
+    Runs per-frame inference off the asyncio event loop.
+
+    A session's track waits for each frame's result before it submits the
+    next, so a session has at most one frame in flight and nothing queues
+    up here. Frames that arrive meanwhile wait in the track, or with the
+    "latest" frame policy are dropped by its reader (see frames.py).
+    """
+
+    def __init__(self, warm_up_count: int = 1):
+        self.warm_up_count = warm_up_count
+        self._pending: Dict[str, int] = {}
+        self._released = set()
+        self._busy_time: Dict[str, float] = {}
+        self._jobs: Dict[str, int] = {}
+        self._window_start = time.perf_counter()
+
+    async def submit(self, session, image: np.ndarray,
+                     timestamp: Optional[float] = None) -> Tuple[Dict, Optional[np.ndarray], StageTimer]:
+        session_id = session.session_id
+        self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        # Closing a session cancels the track waiting here, but not the worker running its frame, so the
+        # frame is only accounted for, and the session's estimator only returned, once the work is done
+        work = asyncio.ensure_future(self._run(session, image, timestamp))
+        work.add_done_callback(partial(self._frame_done, session))
+        _, _, result = await asyncio.shield(work)
+        return result
+
+    def _frame_done(self, session, work: asyncio.Future):
+        session_id = session.session_id
+        self._pending[session_id] -= 1
+        if session_id in self._released and self._pending[session_id] == 0:
+            self._finish_release(session)
+        if work.cancelled() or work.exception() is not None:
+            return
+        worker_id, elapsed, _ = work.result()
+        self._busy_time[worker_id] = self._busy_time.get(worker_id, 0.0) + elapsed
+        self._jobs[worker_id] = self._jobs.get(worker_id, 0) + 1
+
+    async def _run(self, session, image: np.ndarray, timestamp: Optional[float]):
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """Builds and exercises the pose estimators of every session backend before the worker takes traffic."""
+        raise NotImplementedError
+
+    async def probe(self, count: int) -> Dict[str, List[float]]:
+        """Seconds each of `count` inferences took per session backend, on the executor's own workers."""
+        raise NotImplementedError
+
+    async def open_session(self, session):
+        """Sets up the session's estimator ahead of its first frame."""
+        pass
+
+    def update_exercise(self, session):
+        pass
+
+    def release(self, session):
+        # Resources are returned only once a worker has finished the session's last frame
+        if self._pending.get(session.session_id):
+            self._released.add(session.session_id)
+        else:
+            self._finish_release(session)
+
+    def _finish_release(self, session):
+        self._released.discard(session.session_id)
+        self._pending.pop(session.session_id, None)
+        self._release_resources(session)
+
+    def _release_resources(self, session):
+        pass
+
+    def queue_depth(self) -> int:
+        return sum(self._pending.values())
+
+    def utilization(self, reset: bool = False) -> Dict[str, Dict]:
+        """Busy fraction and job count per worker since the last reset."""
+        now = time.perf_counter()
+        window = max(now - self._window_start, 1e-9)
+        stats = {
+            worker_id: {
+                "jobs": self._jobs.get(worker_id, 0),
+                "busySeconds": busy,
+                "utilization": busy / window,
+            }
+            for worker_id, busy in self._busy_time.items()
+        }
+        if reset:
+            self._busy_time.clear()
+            self._jobs.clear()
+            self._window_start = now
+        return stats
+
+    def shutdown(self):
+        raise NotImplementedError
+
+
+class ThreadPoolInferenceExecutor(InferenceExecutor):
+    """
+    Runs the session's own processor in a thread pool. OpenCV and MediaPipe
+    release the GIL during heavy work, so threads scale across cores.
+    """
+
+    def __init__(self, workers: int, warm_up_count: int = 1):
+        super().__init__(warm_up_count)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.pose_pool = PoseEstimatorPool()
+
+    async def _run(self, session, image, timestamp):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, _timed_call, analyze_frame,
+            session.pose, session.processor, image, session.region, session.smoother, timestamp
+        )
+
+    async def warm_up(self):
+        loop = asyncio.get_running_loop()
+        for backend in session_backends():
+            for options in pose_option_sets():
+                warm_up = partial(self.pose_pool.warm_up, count=self.warm_up_count, backend=backend, **options)
+                await loop.run_in_executor(self._executor, warm_up)
+
+    async def probe(self, count):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _probe_backends, self.pose_pool, count)
+
+    async def open_session(self, session):
+        # Building an estimator when the pool has none idle takes long enough to stall the event loop
+        checkout = partial(self.pose_pool.checkout, **get_processor_class(session.exercise_type).POSE_OPTIONS,
+                           backend=session.pose_backend)
+        session.pose = await asyncio.get_running_loop().run_in_executor(self._executor, checkout)
+        session.processor = get_exercise_processor(session.exercise_type)
+        session.region = InferenceRegion()
+        session.smoother = _create_smoother()
+
+    def update_exercise(self, session):
+        # Keep the pose graph and its tracking state, only swap the rep counting
+        session.processor = get_exercise_processor(session.exercise_type)
+
+    def _release_resources(self, session):
+        if session.pose is not None:
+            # Resetting a MediaPipe graph runs an inference, so it stays off the event loop too
+            self._executor.submit(self.pose_pool.checkin, session.pose)
+            session.pose = None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.pose_pool.close()
+
+
+class ProcessPoolInferenceExecutor(InferenceExecutor):
+    """
+    Runs inference in worker processes. Pose models are not picklable, so each
+    worker builds its own processors and a session is pinned to one worker for
+    its lifetime to keep the rep-counting state in a single place.
+    """
+
+    def __init__(self, workers: int, warm_up_count: int = 1):
+        super().__init__(warm_up_count)
+        # MediaPipe's internal threads do not survive fork(), so always spawn.
+        context = multiprocessing.get_context("spawn")
+        self._workers = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                initializer=_worker_init, initargs=(warm_up_count,))
+            for _ in range(workers)
+        ]
+        self._assignments: Dict[str, int] = {}
+
+    def _worker_for(self, session_id: str) -> ProcessPoolExecutor:
+        index = self._assignments.get(session_id)
+        if index is None:
+            load = [0] * len(self._workers)
+            for assigned in self._assignments.values():
+                load[assigned] += 1
+            index = load.index(min(load))
+            self._assignments[session_id] = index
+        return self._workers[index]
+
+    async def _run(self, session, image, timestamp):
+        loop = asyncio.get_running_loop()
+        worker_id, elapsed, result = await loop.run_in_executor(
+            self._worker_for(session.session_id), _timed_call,
+            _worker_analyze_frame, session.session_id, session.exercise_type, session.pose_backend, image, timestamp
+        )
+        # The frame was pickled here and unpickled again in the worker
+        result[2].copied += 2 * image.nbytes
+        return worker_id, elapsed, result
+
+    async def warm_up(self):
+        # Worker initializers build the pose graphs; a no-op job waits for them
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(worker, _worker_noop) for worker in self._workers])
+
+    async def probe(self, count):
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[loop.run_in_executor(worker, _worker_probe, count)
+                                         for worker in self._workers])
+        samples: Dict[str, List[float]] = {}
+        for result in results:
+            for backend, seconds in result.items():
+                samples.setdefault(backend, []).extend(seconds)
+        return samples
+
+    async def open_session(self, session):
+        # The worker builds the session's estimator now, not when its first frame arrives
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._worker_for(session.session_id), _worker_open_session,
+                                   session.session_id, session.exercise_type, session.pose_backend)
+
+    def _release_resources(self, session):
+        index = self._assignments.pop(session.session_id, None)
+        if index is not None:
+            self._workers[index].submit(_worker_release_session, session.session_id)
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.shutdown(wait=False, cancel_futures=True)
+
+
+class _BatchJob:
+    __slots__ = ("session", "image", "timestamp", "future", "enqueued")
+
+    def __init__(self, session, image: np.ndarray, timestamp: Optional[float], future: asyncio.Future):
+        self.session = session
+        self.image = image
+        self.timestamp = timestamp
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class BatchInferenceExecutor(ThreadPoolInferenceExecutor):
+    """
+    Gathers frames from every session into batches, so the stateless pose
+    backends (BATCH_BACKENDS) serve several trainees with one model call.
+
+    A frame waits at most `max_wait` seconds for others to join; the batch
+    leaves earlier once every session that can submit a frame has one
+    queued, or it is full. Each batch takes at most one frame per session.
+    Up to `workers` batches run at once in the thread pool.
+    Sessions on MediaPipe, which tracks between frames, keep their own
+    estimator and run one frame at a time inside the batch.
+    """
+
+    def __init__(self, workers: int, warm_up_count: int = 1,
+                 max_wait: float = BATCH_MAX_WAIT_MS / 1e3, max_size: int = BATCH_MAX_SIZE):
+        super().__init__(workers, warm_up_count)
+        self.workers = workers
+        self.max_wait = max_wait
+        self.max_size = max(max_size, 1)
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self._sessions = set()
+        self._queue: List[_BatchJob] = []
+        # Created on the event loop by the first frame
+        self._arrived: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._scheduler: Optional[asyncio.Task] = None
+
+    async def _run(self, session, image, timestamp):
+        if self._scheduler is None:
+            self._arrived = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.workers)
+            self._scheduler = asyncio.ensure_future(self._schedule())
+        job = _BatchJob(session, image, timestamp, asyncio.get_running_loop().create_future())
+        self._queue.append(job)
+        self._arrived.set()
+        return await job.future
+
+    async def _wait_for_frame(self, timeout: Optional[float] = None):
+        self._arrived.clear()
+        try:
+            await asyncio.wait_for(self._arrived.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _batch_full(self) -> bool:
+        queued = {job.session.session_id for job in self._queue}
+        if len(queued) >= self.max_size:
+            return True
+        # Sessions whose frame is already in a running batch cannot add one to this batch
+        return all(session_id in queued or self._pending.get(session_id) for session_id in self._sessions)
+
+    def _take_batch(self) -> List[_BatchJob]:
+        batch, rest, taken = [], [], set()
+        for job in self._queue:
+            if len(batch) < self.max_size and job.session.session_id not in taken:
+                taken.add(job.session.session_id)
+                batch.append(job)
+            else:
+                rest.append(job)
+        self._queue = rest
+        return batch
+
+    async def _schedule(self):
+        while True:
+            while not self._queue:
+                await self._wait_for_frame()
+            # Frames keep arriving while every worker is busy, which makes for fuller batches
+            await self._slots.acquire()
+            deadline = self._queue[0].enqueued + self.max_wait
+            while not self._batch_full() and time.perf_counter() < deadline:
+                await self._wait_for_frame(deadline - time.perf_counter())
+            asyncio.ensure_future(self._run_batch(self._take_batch()))
+
+    async def _run_batch(self, batch: List[_BatchJob]):
+        loop = asyncio.get_running_loop()
+        self.batch_sizes.observe(len(batch))
+        try:
+            results = await loop.run_in_executor(self._executor, self._analyze_batch, batch)
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self._slots.release()
+        for job, result in zip(batch, results):
+            # The session may have stopped waiting for its frame
+            if job.future.done():
+                continue
+            if isinstance(result, Exception):
+                job.future.set_exception(result)
+            else:
+                job.future.set_result(result)
+
+    def _analyze_batch(self, batch: List[_BatchJob]):
+        """Runs in the thread pool. Returns (worker id, share of the batch's time, result) or an error per frame."""
+        started = time.perf_counter()
+        timers, images, offsets = [], [], []
+        for job in batch:
+            timer = StageTimer()
+            timer.timings["batch-wait"] = started - job.enqueued
+            image, offset = prepare_inference(job.image, timer, job.session.region)
+            timers.append(timer)
+            images.append(image)
+            offsets.append(offset)
+
+        estimates = [None] * len(batch)
+        groups: Dict[str, List[int]] = {}
+        for index, job in enumerate(batch):
+            if job.session.pose_backend in BATCH_BACKENDS:
+                groups.setdefault(job.session.pose_backend, []).append(index)
+            else:
+                timers[index].restart()
+                estimates[index] = job.session.pose.estimate(images[index])
+                timers[index].lap("inference")
+        for backend, indices in groups.items():
+            pose = self.pose_pool.checkout(**BATCH_POSE_OPTIONS, backend=backend)
+            inference_started = time.perf_counter()
+            try:
+                for index, landmarks in zip(indices, pose.estimate_batch([images[index] for index in indices])):
+                    estimates[index] = landmarks
+            finally:
+                self.pose_pool.checkin(pose)
+            # Every frame in the batch waited for the whole model call
+            seconds = time.perf_counter() - inference_started
+            for index in indices:
+                timers[index].timings["inference"] = seconds
+
+        results = []
+        for job, timer, landmarks, offset in zip(batch, timers, estimates, offsets):
+            session = job.session
+            try:
+                timer.restart()
+                landmarks = finish_inference(landmarks, offset, session.region)
+                timer.lap("inference")
+                timestamp = job.timestamp if job.timestamp is not None else time.perf_counter()
+                if session.smoother is not None:
+                    landmarks = session.smoother(landmarks, timestamp)
+                    timer.lap("smoothing")
+                analysis = session.processor.analyze_exercise(landmarks, timestamp)
+                timer.lap("analysis")
+                results.append((analysis, landmarks, timer))
+            except Exception as e:
+                results.append(e)
+        share = (time.perf_counter() - started) / len(batch)
+        return [result if isinstance(result, Exception) else (_worker_id(), share, result) for result in results]
+
+    async def warm_up(self):
+        loop = asyncio.get_running_loop()
+        for backend in session_backends():
+            if backend in BATCH_BACKENDS:
+                # One shared estimator per batch that can run at the same time
+                plans = [(BATCH_POSE_OPTIONS, self.workers)]
+            else:
+                plans = [(options, self.warm_up_count) for options in pose_option_sets()]
+            for options, count in plans:
+                warm_up = partial(self.pose_pool.warm_up, count=count, backend=backend, **options)
+                await loop.run_in_executor(self._executor, warm_up)
+
+    async def open_session(self, session):
+        self._sessions.add(session.session_id)
+        if session.pose_backend not in BATCH_BACKENDS:
+            await super().open_session(session)
+            return
+        session.processor = get_exercise_processor(session.exercise_type)
+        session.region = InferenceRegion()
+        session.smoother = _create_smoother()
+
+    def _release_resources(self, session):
+        self._sessions.discard(session.session_id)
+        super()._release_resources(session)
+
+    def shutdown(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+        super().shutdown()
+
+
+EXECUTORS = {
+    "thread": ThreadPoolInferenceExecutor,
+    "process": ProcessPoolInferenceExecutor,
+    "batch": BatchInferenceExecutor,
+}
+
+def create_executor(kind: str, workers: int, warm_up_count: int = 1) -> InferenceExecutor:
+    if kind not in EXECUTORS:
+        raise ValueError(f"Unknown inference executor '{kind}'. Expected one of {list(EXECUTORS)}.")
+    return EXECUTORS[kind](workers, warm_up_count)
@@ -0,0 +1,335 @@
+"""
+Exercise definitions as data. Each spec (JSON, or YAML when PyYAML is
+installed) describes one exercise:
+
+    name             key used in offers and exercise-change events
+    poseOptions      settings for the pose estimator it is tracked with
+    side             which body side is analyzed:
+                       {"mode": "fixed", "side": "left"}
+                       {"mode": "visible", "joints": [...], "threshold": 0.7}
+                           left if all joints are visible on it, else right
+                       {"mode": "most_visible", "joints": [...], "threshold": 0.75}
+                           the side with the higher visibility, if either passes
+    angles           named (a, b, c) joint triplets, measured at b
+    posture          conditions that must all hold for the frame to count, e.g.
+                     "shoulder.y < hip.y", "abs(hip.y - ankle.y) <= 0.2" or
+                     "angle.knee < 130". Operands are sums and differences of
+                     numbers, joint coordinates (x, y, z, visibility) and angles
+    count            the angle that drives the up/down state machine, its
+                     "high" and "low" thresholds, the position each zone maps
+                     to, and "repOn", the position whose arrival completes a rep
+    initialPosition  position before the first rep
+
+compile_spec turns a spec into a processor class whose per-frame work is a
+fixed number of array operations over precomputed index tables.
+"""
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import landmarks as lm
+from landmarks import LEFT, RIGHT, SIDE_INDEX, VISIBILITY, joint_angles
+from smoothing import ABOVE, AngleHysteresis
+
+JOINTS = {"shoulder": lm.SHOULDER, "elbow": lm.ELBOW, "wrist": lm.WRIST,
+          "hip": lm.HIP, "knee": lm.KNEE, "ankle": lm.ANKLE}
+SIDES = {"left": LEFT, "right": RIGHT}
+COLUMNS = {"x": lm.X, "y": lm.Y, "z": lm.Z, "visibility": VISIBILITY}
+SIDE_MODES = ("fixed", "visible", "most_visible")
+
+_COMPARISON = re.compile(r"^(.+?)(<=|>=|<|>)(.+)$")
+_ABS = re.compile(r"^abs\((.+)\)$")
+_TERM = re.compile(r"([+-]?)\s*([A-Za-z_][\w.]*|\d+(?:\.\d*)?|\.\d+)\s*")
+
+
+class ExerciseSpecError(ValueError):
+    """Raised for an exercise spec that cannot be compiled."""
+
+
+def _landmark_indices(name: str) -> np.ndarray:
+    """Landmark index of a joint for (left, right); named landmarks like "nose" are the same on both."""
+    if name in JOINTS:
+        return SIDE_INDEX[:, JOINTS[name]]
+    index = getattr(lm, name.upper(), None)
+    if not isinstance(index, int) or not 0 <= index < lm.NUM_LANDMARKS:
+        raise ExerciseSpecError(f"Unknown joint or landmark '{name}'.")
+    return np.array([index, index], dtype=np.intp)
+
+
+class _Variables:
+    """Collects the coordinates and angles a spec refers to, in evaluation order."""
+
+    def __init__(self, angle_names: List[str]):
+        self.coordinates: List[Tuple[str, str]] = []
+        self.angle_names = angle_names
+
+    def index(self, name: str) -> int:
+        if name.startswith("angle."):
+            angle = name[len("angle."):]
+            if angle not in self.angle_names:
+                raise ExerciseSpecError(f"Unknown angle '{angle}'.")
+            # Angles come after every coordinate, so their index is resolved at compile time
+            return -1 - self.angle_names.index(angle)
+        joint, _, column = name.rpartition(".")
+        if column not in COLUMNS:
+            raise ExerciseSpecError(f"'{name}' needs a coordinate: one of {list(COLUMNS)}.")
+        _landmark_indices(joint)
+        if (joint, column) not in self.coordinates:
+            self.coordinates.append((joint, column))
+        return self.coordinates.index((joint, column))
+
+
+def _parse_linear(expression: str, variables: _Variables) -> Tuple[Dict[int, float], float]:
+    coefficients: Dict[int, float] = {}
+    constant = 0.0
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TERM.match(expression, position)
+        if match is None or (position > 0 and not match.group(1)):
+            raise ExerciseSpecError(f"Cannot parse '{expression}'.")
+        sign = -1.0 if match.group(1) == "-" else 1.0
+        token = match.group(2)
+        if token[0].isdigit() or token[0] == ".":
+            constant += sign * float(token)
+        else:
+            index = variables.index(token)
+            coefficients[index] = coefficients.get(index, 0.0) + sign
+        position = match.end()
+    if not expression:
+        raise ExerciseSpecError("Empty expression.")
+    return coefficients, constant
+
+
+def _parse_condition(condition: str, variables: _Variables):
+    """A condition as (coefficients, constant, absolute, threshold, operator): f(values) <op> 0."""
+    match = _COMPARISON.match(condition.strip())
+    if match is None:
+        raise ExerciseSpecError(f"'{condition}' is not a comparison.")
+    left, operator, right = (part.strip() for part in match.groups())
+    absolute = _ABS.match(left)
+    if absolute:
+        left = absolute.group(1)
+    left_terms, left_constant = _parse_linear(left, variables)
+    right_terms, right_constant = _parse_linear(right, variables)
+    if absolute:
+        if right_terms:
+            raise ExerciseSpecError(f"'{condition}': abs() can only be compared with a number.")
+        return left_terms, left_constant, True, right_constant, operator
+    terms = dict(left_terms)
+    for index, coefficient in right_terms.items():
+        terms[index] = terms.get(index, 0.0) - coefficient
+    return terms, left_constant - right_constant, False, 0.0, operator
+
+
+class CompiledExercise:
+    """Index and threshold tables for one exercise spec."""
+
+    def __init__(self, spec: Dict):
+        try:
+            self.name = spec["name"]
+            self.pose_options = dict(spec.get("poseOptions", {}))
+            self._compile_side(spec["side"])
+            self._compile_angles(spec.get("angles", {}))
+            self._compile_posture(spec.get("posture", []))
+            self._compile_count(spec["count"])
+            self.initial_position = spec.get("initialPosition")
+        except KeyError as e:
+            raise ExerciseSpecError(f"Exercise spec is missing {e}.") from None
+
+    def _compile_side(self, side: Dict):
+        self.side_mode = side["mode"]
+        if self.side_mode not in SIDE_MODES:
+            raise ExerciseSpecError(f"Unknown side mode '{self.side_mode}'. Expected one of {list(SIDE_MODES)}.")
+        if self.side_mode == "fixed":
+            if side["side"] not in SIDES:
+                raise ExerciseSpecError(f"Unknown side '{side['side']}'.")
+            self.fixed_side = SIDES[side["side"]]
+            return
+        # (2, K) landmark indices of the joints that decide the side
+        self.side_joints = np.stack([_landmark_indices(joint) for joint in side["joints"]], axis=1)
+        self.side_threshold = float(side["threshold"])
+
+    def _compile_angles(self, angles: Dict[str, List[str]]):
+        self.angle_names = list(angles)
+        for name, joints in angles.items():
+            if len(joints) != 3:
+                raise ExerciseSpecError(f"Angle '{name}' needs three joints.")
+        if angles:
+            # (2, A, 3) triplet table, one row per side
+            self.triplets = np.stack(
+                [np.stack([_landmark_indices(joint) for joint in joints], axis=1) for joints in angles.values()],
+                axis=1,
+            )
+        else:
+            self.triplets = np.empty((2, 0, 3), dtype=np.intp)
+
+    def _compile_posture(self, conditions: List[str]):
+        variables = _Variables(self.angle_names)
+        parsed = [_parse_condition(condition, variables) for condition in conditions]
+
+        # Coordinate lookups per side: landmarks[point_rows[side], point_columns]
+        coordinates = variables.coordinates
+        self.point_rows = np.array([_landmark_indices(joint) for joint, _ in coordinates], dtype=np.intp).reshape(-1, 2).T
+        self.point_columns = np.array([COLUMNS[column] for _, column in coordinates], dtype=np.intp)
+
+        # One row per condition over [coordinates..., angles...]
+        size = len(coordinates) + len(self.angle_names)
+        self.coefficients = np.zeros((len(parsed), size), dtype=np.float32)
+        self.constants = np.zeros(len(parsed), dtype=np.float32)
+        self.absolute = np.zeros(len(parsed), dtype=bool)
+        # Every condition becomes sign * value < limit. "a > b" is "-a < -b",
+        # and "<=" compares against the next float32 up, which is exact
+        self.signs = np.ones(len(parsed), dtype=np.float32)
+        self.limits = np.zeros(len(parsed), dtype=np.float32)
+        for row, (terms, constant, absolute, threshold, operator) in enumerate(parsed):
+            for index, coefficient in terms.items():
+                self.coefficients[row, index if index >= 0 else len(coordinates) - 1 - index] = coefficient
+            self.constants[row] = constant
+            self.absolute[row] = absolute
+            sign = np.float32(1.0 if operator in ("<", "<=") else -1.0)
+            limit = sign * np.float32(threshold)
+            self.signs[row] = sign
+            self.limits[row] = limit if operator in ("<", ">") else np.nextafter(limit, np.float32(np.inf))
+        self.any_absolute = bool(self.absolute.any())
+
+    def _compile_count(self, count: Dict):
+        if count["angle"] not in self.angle_names:
+            raise ExerciseSpecError(f"Count angle '{count['angle']}' is not defined in angles.")
+        self.count_angle = self.angle_names.index(count["angle"])
+        self.high = float(count["high"])
+        self.low = float(count["low"])
+        self.high_position = count["highPosition"]
+        self.low_position = count["lowPosition"]
+        self.rep_on = count["repOn"]
+        if self.rep_on not in (self.high_position, self.low_position):
+            raise ExerciseSpecError(f"repOn '{self.rep_on}' is neither the high nor the low position.")
+        self.rep_from = self.low_position if self.rep_on == self.high_position else self.high_position
+
+    def select_side(self, landmarks: np.ndarray) -> Optional[int]:
+        if self.side_mode == "fixed":
+            return self.fixed_side
+        # Visibility of the weakest joint on each side
+        left, right = landmarks[self.side_joints, VISIBILITY].min(axis=1).tolist()
+        if left <= self.side_threshold and right <= self.side_threshold:
+            return None
+        if self.side_mode == "visible":
+            return LEFT if left > self.side_threshold else RIGHT
+        return LEFT if left >= right else RIGHT
+
+    def evaluate(self, landmarks: np.ndarray, side: int) -> Tuple[bool, np.ndarray]:
+        """Whether every posture condition holds, and the spec's angles for the side."""
+        angles = joint_angles(landmarks, self.triplets[side])
+        if not len(self.constants):
+            return True, angles
+        values = np.concatenate((landmarks[self.point_rows[side], self.point_columns], angles))
+        results = self.coefficients @ values + self.constants
+        if self.any_absolute:
+            np.abs(results, out=results, where=self.absolute)
+        return bool((results * self.signs < self.limits).all()), angles
+
+
+class ExerciseProcessor:
+    """
+    Rep counter driven by a CompiledExercise; compile_spec makes one subclass
+    per spec. On the frame that completes a rep, the analysis also carries a
+    "rep" event: its duration, the count angle's range and the number of
+    frames in it that failed the posture gate.
+    """
+
+    SPEC: CompiledExercise = None
+    POSE_OPTIONS: Dict = {}
+
+    def __init__(self):
+        self.reset_state()
+
+    def reset_state(self):
+        spec = self.SPEC
+        self.rep_count = 0
+        self.last_position = spec.initial_position
+        self.hysteresis = AngleHysteresis(spec.high, spec.low)
+        self._start_rep(None)
+
+    def _start_rep(self, timestamp: Optional[float]):
+        self.rep_started = timestamp
+        self.rep_min_angle = np.inf
+        self.rep_max_angle = -np.inf
+        self.rep_posture_failures = 0
+
+    def analyze_exercise(self, landmarks: Optional[np.ndarray], timestamp: Optional[float] = None) -> Dict:
+        if landmarks is None:
+            return {"repCount": self.rep_count, "position": self.last_position}
+
+        spec = self.SPEC
+        side = spec.select_side(landmarks)
+        if side is None:
+            self.rep_posture_failures += 1
+            return {"repCount": self.rep_count, "position": "unknown"}
+
+        posture_ok, angles = spec.evaluate(landmarks, side)
+        if not posture_ok:
+            self.rep_posture_failures += 1
+            return {"repCount": self.rep_count, "position": "unknown"}
+
+        angle = float(angles[spec.count_angle])
+        if self.rep_started is None:
+            self.rep_started = timestamp
+        self.rep_min_angle = min(self.rep_min_angle, angle)
+        self.rep_max_angle = max(self.rep_max_angle, angle)
+
+        rep = None
+        zone = self.hysteresis.update(angle)
+        if zone is not None:
+            position = spec.high_position if zone == ABOVE else spec.low_position
+            if position == spec.rep_on and self.last_position == spec.rep_from:
+                self.rep_count += 1
+                rep = {
+                    "duration": 0.0 if timestamp is None or self.rep_started is None else timestamp - self.rep_started,
+                    "minAngle": self.rep_min_angle,
+                    "maxAngle": self.rep_max_angle,
+                    "postureFailures": self.rep_posture_failures,
+                }
+                # The next rep starts where this one ended
+                self._start_rep(timestamp)
+                self.rep_min_angle = self.rep_max_angle = angle
+            self.last_position = position
+
+        analysis = {"repCount": self.rep_count, "position": self.last_position}
+        if rep is not None:
+            analysis["rep"] = rep
+        return analysis
+
+
+def compile_spec(spec: Dict) -> type:
+    compiled = CompiledExercise(spec)
+    class_name = "".join(part.capitalize() for part in re.split(r"[^A-Za-z0-9]+", compiled.name)) + "ExerciseProcessor"
+    return type(class_name, (ExerciseProcessor,), {"SPEC": compiled, "POSE_OPTIONS": compiled.pose_options})
+
+
+def load_spec(path) -> Dict:
+    path = Path(path)
+    with open(path) as f:
+        if path.suffix.lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ExerciseSpecError(f"{path} needs PyYAML: pip install pyyaml") from None
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def load_exercises(directory) -> Dict[str, type]:
+    """Compiles every spec in a directory into a processor class, keyed by exercise name."""
+    processors = {}
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() not in (".json", ".yaml", ".yml"):
+            continue
+        try:
+            processor_class = compile_spec(load_spec(path))
+        except ExerciseSpecError as e:
+            raise ExerciseSpecError(f"{path}: {e}") from None
+        processors[processor_class.SPEC.name] = processor_class
+    return processors
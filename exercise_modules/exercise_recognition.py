@@ -0,0 +1,108 @@
+"""
+Recognizes which exercise a trainee is doing from their recent landmarks,
+so a session can switch its rep counting without the client choosing.
+
+Every analyzed frame, each exercise spec's own posture conditions and count
+angle are evaluated and kept in a ring buffer. An exercise scores well when
+its posture holds for most of the window and its count angle sweeps the
+span between the spec's "low" and "high" thresholds, i.e. when the frames
+would actually count reps. Standing still or holding a pose scores nothing,
+so the current exercise is kept until the trainee clearly starts another.
+"""
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from processors import PROCESSORS
+
+# Analyzed frames the recognizer looks back over, long enough to hold a slow rep
+RECOGNITION_WINDOW = int(os.environ.get("RECOGNITION_WINDOW", "120"))
+# Analyzed frames between classifications
+RECOGNITION_INTERVAL = int(os.environ.get("RECOGNITION_INTERVAL", "10"))
+# Lowest score (posture fraction times count angle coverage) an exercise needs to be recognized
+RECOGNITION_MIN_SCORE = float(os.environ.get("RECOGNITION_MIN_SCORE", "0.5"))
+# Consecutive classifications that must agree before the exercise switches
+RECOGNITION_CONFIRM = int(os.environ.get("RECOGNITION_CONFIRM", "2"))
+
+
+class ExerciseRecognizer:
+    """Per-session classifier over a rolling window of landmark arrays."""
+
+    def __init__(self, exercises: Optional[Dict[str, type]] = None, window: int = RECOGNITION_WINDOW,
+                 interval: int = RECOGNITION_INTERVAL, min_score: float = RECOGNITION_MIN_SCORE,
+                 confirm: int = RECOGNITION_CONFIRM):
+        exercises = PROCESSORS if exercises is None else exercises
+        self.names = list(exercises)
+        self.specs = [processor_class.SPEC for processor_class in exercises.values()]
+        self.window = window
+        self.interval = interval
+        self.min_score = min_score
+        self.confirm = confirm
+        # (window, exercises) ring buffers: whether the posture held, and the count angle when it did
+        self._posture = np.zeros((window, len(self.specs)), dtype=bool)
+        self._angles = np.zeros((window, len(self.specs)), dtype=np.float32)
+        self._frames = 0
+        self._candidate = None
+        self._agreed = 0
+        self.exercise: Optional[str] = None
+
+    def update(self, landmarks: Optional[np.ndarray]) -> Optional[str]:
+        """Adds one analyzed frame. Returns the recognized exercise, or None until one is."""
+        row = self._frames % self.window
+        self._frames += 1
+        if landmarks is None:
+            self._posture[row] = False
+        else:
+            for column, spec in enumerate(self.specs):
+                side = spec.select_side(landmarks)
+                if side is None:
+                    self._posture[row, column] = False
+                    continue
+                posture_ok, angles = spec.evaluate(landmarks, side)
+                self._posture[row, column] = posture_ok
+                self._angles[row, column] = angles[spec.count_angle]
+
+        # Classify on a full enough window, every `interval` frames
+        if self._frames >= self.window // 2 and self._frames % self.interval == 0:
+            self._classify()
+        return self.exercise
+
+    def scores(self) -> Dict[str, float]:
+        """Score of every exercise over the frames in the window."""
+        filled = min(self._frames, self.window)
+        if not filled:
+            return dict.fromkeys(self.names, 0.0)
+        posture = self._posture[:filled]
+        fractions = posture.mean(axis=0)
+        scores = {}
+        for column, (name, spec) in enumerate(zip(self.names, self.specs)):
+            held = self._angles[:filled, column][posture[:, column]]
+            if len(held) < 2:
+                scores[name] = 0.0
+                continue
+            # Percentiles rather than min and max, so a few bad landmark frames do not count as motion
+            low, high = np.percentile(held, (10, 90))
+            coverage = (min(high, spec.high) - max(low, spec.low)) / (spec.high - spec.low)
+            scores[name] = float(fractions[column] * min(max(coverage, 0.0), 1.0))
+        return scores
+
+    def _classify(self):
+        scores = self.scores()
+        best = max(scores, key=scores.get)
+        if scores[best] < self.min_score:
+            self._candidate, self._agreed = None, 0
+            return
+        if best == self._candidate:
+            self._agreed += 1
+        else:
+            self._candidate, self._agreed = best, 1
+        if self._agreed >= self.confirm:
+            self.exercise = best
+
+    def reset(self):
+        """Forgets the window and the recognized exercise, as if no frames had been seen."""
+        self._posture[:] = False
+        self._frames = 0
+        self._candidate, self._agreed = None, 0
+        self.exercise = None
@@ -0,0 +1,115 @@
+import os
+import struct
+from typing import Dict, Optional
+
+# Position changes closer together than this are merged into one message
+FEEDBACK_MIN_INTERVAL = float(os.environ.get("FEEDBACK_MIN_INTERVAL", "0.1"))
+# Full state is resent this often, even if nothing changed, so clients recover from gaps
+FEEDBACK_KEYFRAME_INTERVAL = float(os.environ.get("FEEDBACK_KEYFRAME_INTERVAL", "2.0"))
+
+# Message layout, little-endian: uint32 sequence number, uint8 flags, then
+# uint16 rep count if FLAG_REP_COUNT and uint8 position code if FLAG_POSITION.
+# Fields are absolute values, so a delta only lists what changed.
+HEADER = struct.Struct("<IB")
+REP_COUNT = struct.Struct("<H")
+POSITION = struct.Struct("<B")
+
+FLAG_KEYFRAME = 1
+FLAG_REP_COMPLETED = 2
+FLAG_REP_COUNT = 4
+FLAG_POSITION = 8
+
+POSITIONS = (None, "up", "down", "unknown")
+POSITION_CODES = {position: code for code, position in enumerate(POSITIONS)}
+
+
+def encode_feedback(sequence: int, flags: int, rep_count: Optional[int] = None, position: Optional[str] = None,
+                    has_position: bool = False) -> bytes:
+    if rep_count is not None:
+        flags |= FLAG_REP_COUNT
+    if has_position:
+        flags |= FLAG_POSITION
+    packet = HEADER.pack(sequence & 0xFFFFFFFF, flags)
+    if rep_count is not None:
+        packet += REP_COUNT.pack(min(rep_count, 0xFFFF))
+    if has_position:
+        packet += POSITION.pack(POSITION_CODES.get(position, POSITION_CODES["unknown"]))
+    return packet
+
+
+def decode_feedback(packet: bytes) -> Dict:
+    """The inverse of encode_feedback, for tools and tests; the browser has its own decoder."""
+    sequence, flags = HEADER.unpack_from(packet)
+    offset = HEADER.size
+    message = {"seq": sequence, "keyframe": bool(flags & FLAG_KEYFRAME), "repCompleted": bool(flags & FLAG_REP_COMPLETED)}
+    if flags & FLAG_REP_COUNT:
+        message["repCount"], = REP_COUNT.unpack_from(packet, offset)
+        offset += REP_COUNT.size
+    if flags & FLAG_POSITION:
+        code, = POSITION.unpack_from(packet, offset)
+        message["position"] = POSITIONS[code] if code < len(POSITIONS) else "unknown"
+    return message
+
+
+def merge_feedback(older: bytes, newer: bytes) -> bytes:
+    """
+    One message with the state of two, for when `older` was never sent: the
+    newer sequence number and fields, plus the older fields the newer one
+    does not list. Flags carry over, so a completed rep is not lost.
+    """
+    old, new = decode_feedback(older), decode_feedback(newer)
+    flags = 0
+    if old["keyframe"] or new["keyframe"]:
+        flags |= FLAG_KEYFRAME
+    if old["repCompleted"] or new["repCompleted"]:
+        flags |= FLAG_REP_COMPLETED
+    merged = {**old, **new}
+    return encode_feedback(new["seq"], flags, merged.get("repCount"), merged.get("position"), "position" in merged)
+
+
+class FeedbackEncoder:
+    """
+    Turns the per-frame analysis stream of one session into feedback messages.
+    A completed rep is sent at once, position changes at most every
+    `min_interval` seconds, and otherwise nothing but a keyframe with the full
+    state every `keyframe_interval` seconds.
+    """
+
+    def __init__(self, min_interval: float = FEEDBACK_MIN_INTERVAL,
+                 keyframe_interval: float = FEEDBACK_KEYFRAME_INTERVAL):
+        self.min_interval = min_interval
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+        self.sent = 0
+        self._rep_count = None
+        self._position = None
+        self._last_sent = None
+        self._last_keyframe = None
+
+    def update(self, analysis: Dict, now: float) -> Optional[bytes]:
+        rep_count = analysis.get("repCount", 0)
+        position = analysis.get("position")
+
+        if self._last_keyframe is None or now - self._last_keyframe >= self.keyframe_interval:
+            self._last_keyframe = now
+            flags = FLAG_KEYFRAME
+            if self._rep_count is not None and rep_count > self._rep_count:
+                flags |= FLAG_REP_COMPLETED
+            return self._send(now, flags, rep_count, position, rep_count, True)
+
+        rep_changed = rep_count != self._rep_count
+        position_changed = position != self._position
+        if not rep_changed and not (position_changed and now - self._last_sent >= self.min_interval):
+            return None
+
+        flags = FLAG_REP_COMPLETED if rep_count > self._rep_count else 0
+        return self._send(now, flags, rep_count,
+                          position, rep_count if rep_changed else None, position_changed)
+
+    def _send(self, now, flags, rep_count, position, sent_rep_count, has_position) -> bytes:
+        self._rep_count = rep_count
+        self._position = position
+        self._last_sent = now
+        self.sequence += 1
+        self.sent += 1
+        return encode_feedback(self.sequence, flags, sent_rep_count, position, has_position)
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Optional
+
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+
+class LatestFrameReader:
+    """
+    Reads a track in the background and keeps only the newest frame, so a slow
+    consumer always gets the most recent image instead of working through a
+    backlog. Frames that are replaced before being consumed count as dropped.
+    """
+
+    def __init__(self, track: MediaStreamTrack):
+        self.track = track
+        self.received = 0
+        self.dropped = 0
+        self._frame = None
+        self._ended = False
+        self._new_frame = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        try:
+            while True:
+                frame = await self.track.recv()
+                self.received += 1
+                if self._frame is not None:
+                    self.dropped += 1
+                self._frame = frame
+                self._new_frame.set()
+        except MediaStreamError:
+            self._ended = True
+            self._new_frame.set()
+
+    async def recv(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+        # The event can be left set by a frame that was already taken, so wait until there really is one
+        while self._frame is None:
+            if self._ended:
+                raise MediaStreamError
+            await self._new_frame.wait()
+            self._new_frame.clear()
+
+        frame, self._frame = self._frame, None
+        self._new_frame.clear()
+        return frame
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.track.stop()
@@ -0,0 +1,85 @@
+import numpy as np
+
+# Pose landmark indices, matching mediapipe's PoseLandmark enum. Kept here so
+# the exercise analyzers can run (and be tested) without importing MediaPipe.
+NOSE = 0
+LEFT_EYE_INNER = 1
+LEFT_EYE = 2
+LEFT_EYE_OUTER = 3
+RIGHT_EYE_INNER = 4
+RIGHT_EYE = 5
+RIGHT_EYE_OUTER = 6
+LEFT_EAR = 7
+RIGHT_EAR = 8
+MOUTH_LEFT = 9
+MOUTH_RIGHT = 10
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_PINKY = 17
+RIGHT_PINKY = 18
+LEFT_INDEX = 19
+RIGHT_INDEX = 20
+LEFT_THUMB = 21
+RIGHT_THUMB = 22
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+LEFT_HEEL = 29
+RIGHT_HEEL = 30
+LEFT_FOOT_INDEX = 31
+RIGHT_FOOT_INDEX = 32
+
+NUM_LANDMARKS = 33
+
+# Columns of a landmark array: one row per landmark, shape (NUM_LANDMARKS, 4)
+X, Y, Z, VISIBILITY = 0, 1, 2, 3
+
+POSE_CONNECTIONS = (
+    (0, 1), (0, 4), (1, 2), (2, 3), (3, 7), (4, 5), (5, 6), (6, 8), (9, 10),
+    (11, 12), (11, 13), (11, 23), (12, 14), (12, 24), (13, 15), (14, 16),
+    (15, 17), (15, 19), (15, 21), (16, 18), (16, 20), (16, 22), (17, 19),
+    (18, 20), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28), (27, 29),
+    (27, 31), (28, 30), (28, 32), (29, 31), (30, 32)
+)
+
+# Joint columns of SIDE_INDEX, and its rows
+SHOULDER, ELBOW, WRIST, HIP, KNEE, ANKLE = range(6)
+LEFT, RIGHT = 0, 1
+
+# Landmark index for each side and joint, e.g. SIDE_INDEX[LEFT, HIP] == LEFT_HIP
+SIDE_INDEX = np.array([
+    [LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST, LEFT_HIP, LEFT_KNEE, LEFT_ANKLE],
+    [RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST, RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE],
+], dtype=np.intp)
+
+
+def side_triplets(*joints) -> np.ndarray:
+    """
+    Builds a (2, K, 3) landmark index table from K (a, b, c) joint triplets,
+    one row per side, ready to pass to joint_angles.
+    """
+    return SIDE_INDEX[:, np.array(joints, dtype=np.intp)]
+
+
+def joint_angles(landmarks: np.ndarray, triplets: np.ndarray) -> np.ndarray:
+    """
+    Angles at the middle landmark of each (a, b, c) triplet in degrees, in the
+    image plane, between 0 and 180.
+
+    `landmarks` is a (NUM_LANDMARKS, 4) array or a (N, NUM_LANDMARKS, 4) batch
+    and `triplets` has shape (..., 3). The result has shape
+    landmarks.shape[:-2] + triplets.shape[:-1].
+    """
+    # One gather for every point, then both arm vectors of every triplet at once
+    points = landmarks[..., triplets, :2]
+    arms = points[..., ::2, :] - points[..., 1:2, :]
+    directions = np.arctan2(arms[..., 1], arms[..., 0])
+    angle = np.abs(np.degrees(directions[..., 1] - directions[..., 0]))
+    return np.minimum(angle, 360.0 - angle)
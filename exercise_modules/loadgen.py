@@ -0,0 +1,561 @@
+"""
+Load generator: how many concurrent trainees can one mlModels.py worker hold?
+
+    python loadgen.py --ramp 1,2,4,8 --step-seconds 20 --output load.json
+    python loadgen.py --video analysis/squat_demo.mp4 --resolution 1280x720 --fps 30
+    python loadgen.py --no-spawn --port 5000      # a worker is already pointed here
+
+Stands in for the Node.js signaling server on localhost: the worker (started
+here with SIGNALING_URL pointing at it, unless --no-spawn) registers with it
+as usual, and each simulated trainee is an aiortc peer connection that goes
+through the same webrtc-offer, ice-candidate and exercise-change messages a
+browser sends through Node. Candidates are trickled like a browser does, not
+left in the offer.
+
+Every outgoing frame carries its number as a row of black and white blocks
+along the bottom edge. The worker draws on and re-encodes the frame, and the
+number is read back from the returned video, so end-to-end latency covers
+both encodes, both network hops and inference. In "landmarks" output mode no
+video comes back; latency is not measured and landmark packets are counted
+instead. Frames never returned were dropped, either skipped by the worker or
+lost on the way.
+
+Each ramp step starts N fresh sessions, lets them settle, measures for
+--step-seconds and closes them. CPU use is reported for the worker (from
+/proc, Linux only) and for this process, which does all the clients' video
+encoding and decoding on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from fractions import Fraction
+from pathlib import Path
+
+import av
+import cv2
+import numpy as np
+import socketio
+from aiohttp import web
+from aiortc import MediaStreamTrack, RTCPeerConnection, RTCSessionDescription
+from aiortc.mediastreams import MediaStreamError
+
+VIDEO_CLOCK = Fraction(1, 90000)
+# Frame numbers are drawn as this many bits, which wrap well after any sane step length
+MARKER_BITS = 16
+# Lines in an offer that are sent as trickled candidates instead
+CANDIDATE_LINE = re.compile(r"^a=(candidate:.*|end-of-candidates)$")
+
+
+def marker_size(width: int) -> int:
+    """Side of one block of the frame number; large enough to survive VP8 at low bitrates."""
+    return max(8, width // (MARKER_BITS * 2))
+
+
+def draw_marker(image: np.ndarray, number: int):
+    size = marker_size(image.shape[1])
+    top = image.shape[0] - size
+    for bit in range(MARKER_BITS):
+        image[top:, bit * size:(bit + 1) * size] = 255 if number >> bit & 1 else 0
+
+
+def read_marker(image: np.ndarray) -> int:
+    size = marker_size(image.shape[1])
+    # Sample the middle of each block, away from edges smeared by the codec
+    row = image[image.shape[0] - size + size // 4:image.shape[0] - size // 4]
+    number = 0
+    for bit in range(MARKER_BITS):
+        block = row[:, bit * size + size // 4:(bit + 1) * size - size // 4]
+        if block.mean() > 128:
+            number |= 1 << bit
+    return number
+
+
+def synthetic_frames(width: int, height: int, count: int = 60):
+    """A bar sweeping across a gradient, so the encoder has motion to work on."""
+    gradient = np.linspace(40, 200, width, dtype=np.uint8)
+    background = np.dstack([np.tile(gradient, (height, 1))] * 3)
+    frames = []
+    for index in range(count):
+        frame = background.copy()
+        x = index * width // count
+        cv2.rectangle(frame, (x, height // 4), (x + width // 10, 3 * height // 4), (0, 160, 255), -1)
+        frames.append(frame)
+    return frames
+
+
+def video_frames(path: str, width: int, height: int, limit: int):
+    """Frames of a video file at the test resolution, shared by every client and looped."""
+    frames = []
+    with av.open(path) as container:
+        for frame in container.decode(video=0):
+            frames.append(frame.to_ndarray(format="bgr24", width=width, height=height))
+            if len(frames) >= limit:
+                break
+    if not frames:
+        raise SystemExit(f"No video frames in {path}.")
+    return frames
+
+
+class MarkedVideoTrack(MediaStreamTrack):
+    """Loops `frames` at `fps`, numbering each one and noting when aiortc took it for sending."""
+
+    kind = "video"
+
+    def __init__(self, frames, fps: float, on_sent):
+        super().__init__()
+        self.frames = frames
+        self.fps = fps
+        self.on_sent = on_sent
+        self.count = 0
+        self._started = None
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        if self._started is None:
+            self._started = time.perf_counter()
+        await asyncio.sleep(max(self._started + self.count / self.fps - time.perf_counter(), 0.0))
+
+        number = self.count % (1 << MARKER_BITS)
+        image = self.frames[self.count % len(self.frames)].copy()
+        draw_marker(image, number)
+        frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+        frame.pts = int(self.count / self.fps / VIDEO_CLOCK)
+        frame.time_base = VIDEO_CLOCK
+        self.count += 1
+        self.on_sent(number)
+        return frame
+
+
+def summarize(samples):
+    if not samples:
+        return None
+    samples = np.asarray(samples) * 1e3
+    return {
+        "meanMs": round(float(samples.mean()), 2),
+        "p50Ms": round(float(np.percentile(samples, 50)), 2),
+        "p95Ms": round(float(np.percentile(samples, 95)), 2),
+        "maxMs": round(float(samples.max()), 2),
+    }
+
+
+class SimulatedTrainee:
+    """One browser session: offer, trickled candidates, video out, and whatever comes back."""
+
+    def __init__(self, client_id: str, signaling, frames, args):
+        self.client_id = client_id
+        self.signaling = signaling
+        self.args = args
+        self.pc = RTCPeerConnection()
+        self.track = MarkedVideoTrack(frames, args.fps, self._on_sent)
+        self.answer = asyncio.get_event_loop().create_future()
+        self.rejected = None
+        self.measuring = False
+        self.sending = True
+        self.sent = 0
+        self.sent_at = {}
+        self.latencies = []
+        self.returned = 0
+        self.unreadable = 0
+        self.landmark_packets = 0
+        self.feedback_messages = 0
+        self.exercise_changes = 0
+        self.connect_seconds = None
+        self._tasks = []
+
+    def _on_sent(self, number):
+        counted = self.measuring and self.sending
+        self.sent += counted
+        self.sent_at[number] = (time.perf_counter(), counted)
+
+    async def _read_video(self, track):
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                return
+            received = time.perf_counter()
+            # The number is black and white, so the luma plane alone is enough to read it
+            sent = self.sent_at.pop(read_marker(frame.to_ndarray(format="gray")), None)
+            if not self.measuring:
+                continue
+            if sent is None:
+                self.unreadable += 1
+            elif sent[1]:
+                self.returned += 1
+                self.latencies.append(received - sent[0])
+
+    def _count_packet(self, attribute):
+        def on_message(message):
+            if self.measuring and self.sending:
+                setattr(self, attribute, getattr(self, attribute) + 1)
+        return on_message
+
+    async def start(self):
+        self.pc.addTrack(self.track)
+        # The same channels the studio page opens
+        feedback = self.pc.createDataChannel("feedback")
+        feedback.on("message", self._count_packet("feedback_messages"))
+        if self.args.output_mode == "landmarks":
+            pose = self.pc.createDataChannel("pose", ordered=False, maxRetransmits=0)
+            pose.on("message", self._count_packet("landmark_packets"))
+
+        @self.pc.on("track")
+        def on_track(track):
+            self._tasks.append(asyncio.ensure_future(self._read_video(track)))
+
+        started = time.perf_counter()
+        connected = asyncio.get_event_loop().create_future()
+
+        @self.pc.on("connectionstatechange")
+        def on_connectionstatechange():
+            if self.pc.connectionState == "connected" and not connected.done():
+                connected.set_result(None)
+
+        await self.pc.setLocalDescription(await self.pc.createOffer())
+        offer, candidates = split_candidates(self.pc.localDescription.sdp)
+        await self.signaling.to_worker("webrtc-offer", self.client_id, {
+            "type": "offer", "sdp": offer,
+            "exerciseType": self.args.exercises[0], "outputMode": self.args.output_mode,
+            "poseBackend": self.args.pose_backend,
+        })
+        answer = await asyncio.wait_for(self.answer, timeout=30)
+        if answer is None:
+            return False
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp=answer["sdp"], type=answer["type"]))
+        for candidate in candidates:
+            await self.signaling.to_worker("ice-candidate", self.client_id, candidate)
+        await asyncio.wait_for(connected, timeout=30)
+        self.connect_seconds = time.perf_counter() - started
+
+        if self.args.exercise_change_seconds > 0:
+            self._tasks.append(asyncio.ensure_future(self._change_exercises()))
+        return True
+
+    async def _change_exercises(self):
+        exercises = self.args.exercises
+        index = 0
+        while True:
+            await asyncio.sleep(self.args.exercise_change_seconds)
+            index += 1
+            await self.signaling.to_worker("exercise-change", self.client_id,
+                                           {"exerciseType": exercises[index % len(exercises)]})
+            if self.measuring:
+                self.exercise_changes += 1
+
+    def start_measuring(self):
+        self.measuring = True
+
+    def stop_sending(self):
+        """Frames keep flowing so the connection stays up, but later ones are not counted."""
+        self.sending = False
+
+    async def close(self):
+        self.measuring = False
+        for task in self._tasks:
+            task.cancel()
+        await self.pc.close()
+        await self.signaling.to_worker("client-disconnected", self.client_id, {})
+
+    def report(self, seconds: float):
+        if self.rejected is not None:
+            return {"client": self.client_id, "rejected": self.rejected}
+        result = {
+            "client": self.client_id,
+            "connectSeconds": round(self.connect_seconds, 3),
+            "sent": self.sent,
+            "feedbackMessages": self.feedback_messages,
+            "exerciseChanges": self.exercise_changes,
+        }
+        if self.args.output_mode == "video":
+            result.update({
+                "returned": self.returned,
+                "dropped": self.sent - self.returned,
+                "droppedRatio": round(1 - self.returned / max(self.sent, 1), 4),
+                "unreadable": self.unreadable,
+                "returnedFps": round(self.returned / seconds, 1),
+                "latency": summarize(self.latencies),
+            })
+        else:
+            result.update({
+                "landmarkPackets": self.landmark_packets,
+                "landmarkFps": round(self.landmark_packets / seconds, 1),
+            })
+        return result
+
+
+def split_candidates(sdp: str):
+    """Removes the candidates aiortc gathers into the offer and returns them as a browser trickles them."""
+    lines, candidates = [], []
+    mid, index = None, -1
+    for line in sdp.splitlines():
+        if line.startswith("m="):
+            index += 1
+            mid = None
+        elif line.startswith("a=mid:"):
+            mid = line[len("a=mid:"):]
+        match = CANDIDATE_LINE.match(line)
+        if match is None:
+            lines.append(line)
+        elif match.group(1) != "end-of-candidates":
+            candidates.append({"candidate": match.group(1), "sdpMid": mid, "sdpMLineIndex": index})
+    return "\r\n".join(lines) + "\r\n", candidates
+
+
+class FakeSignalingServer:
+    """The part of backend/utils/socketHandler.js the worker talks to, with the trainees in-process."""
+
+    def __init__(self):
+        self.sio = socketio.AsyncServer(async_mode="aiohttp")
+        self.app = web.Application()
+        self.sio.attach(self.app, socketio_path="socket.io")
+        self.worker_sid = None
+        self.worker_status = None
+        self.worker_connected = asyncio.Event()
+        self.clients = {}
+        self.sio.on("connect-python", self._on_connect_python)
+        self.sio.on("worker-heartbeat", self._on_worker_status)
+        self.sio.on("worker-draining", self._on_worker_status)
+        self.sio.on("disconnect", self._on_disconnect)
+        self.sio.on("webrtc-answer", self._on_answer)
+        self.sio.on("session-rejected", self._on_rejected)
+        self.sio.on("exercise-feedback", self._on_feedback)
+
+    async def start(self, host: str, port: int):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def to_worker(self, event: str, client_id: str, data: dict):
+        # Node stamps every relayed message with the sender's socket id
+        await self.sio.emit(event, {**data, "from": client_id}, to=self.worker_sid)
+
+    async def _on_connect_python(self, sid, data=None):
+        self.worker_sid = sid
+        self.worker_status = data
+        self.worker_connected.set()
+
+    async def _on_worker_status(self, sid, data):
+        if sid == self.worker_sid:
+            self.worker_status = data
+
+    async def _on_disconnect(self, sid, *args):
+        if sid == self.worker_sid:
+            print("Worker disconnected.", file=sys.stderr)
+            self.worker_sid = None
+            self.worker_connected.clear()
+
+    async def _on_answer(self, sid, data):
+        client = self.clients.get(data.pop("to", None))
+        if client is not None and not client.answer.done():
+            client.answer.set_result(data)
+
+    async def _on_rejected(self, sid, data):
+        client = self.clients.get(data.get("to"))
+        if client is not None:
+            client.rejected = data.get("message") or "rejected"
+            if not client.answer.done():
+                client.answer.set_result(None)
+
+    async def _on_feedback(self, sid, data):
+        client = self.clients.get(data.get("to"))
+        if client is not None and client.measuring and client.sending:
+            client.feedback_messages += 1
+
+
+def process_cpu_seconds(pid: int):
+    """User plus system CPU time of another process, or None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime, fields 14 and 15 of proc(5), counted after the command name
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def cpu_percent(start, end, seconds):
+    if start is None or end is None:
+        return None
+    return round((end - start) / seconds * 100, 1)
+
+
+async def run_step(signaling, frames, count: int, step: int, args):
+    clients = [SimulatedTrainee(f"load-{step}-{index}", signaling, frames, args) for index in range(count)]
+    for client in clients:
+        signaling.clients[client.client_id] = client
+    try:
+        started = await asyncio.gather(*[client.start() for client in clients], return_exceptions=True)
+        for client, result in zip(clients, started):
+            if isinstance(result, Exception) and client.rejected is None:
+                client.rejected = f"failed to connect: {result!r}"
+        await asyncio.sleep(args.settle_seconds)
+
+        for client in clients:
+            client.start_measuring()
+        worker_cpu = process_cpu_seconds(args.worker_pid) if args.worker_pid else None
+        own_cpu = time.process_time()
+        measure_started = time.perf_counter()
+        await asyncio.sleep(args.step_seconds)
+        seconds = time.perf_counter() - measure_started
+        worker_cpu_end = process_cpu_seconds(args.worker_pid) if args.worker_pid else None
+        own_cpu_end = time.process_time()
+
+        for client in clients:
+            client.stop_sending()
+        # Frames already on their way still count as returned
+        await asyncio.sleep(args.drain_seconds)
+    finally:
+        await asyncio.gather(*[client.close() for client in clients], return_exceptions=True)
+        for client in clients:
+            signaling.clients.pop(client.client_id, None)
+
+    sessions = [client.report(seconds) for client in clients]
+    accepted = [session for session in sessions if "rejected" not in session]
+    result = {
+        "sessions": count,
+        "accepted": len(accepted),
+        "rejected": count - len(accepted),
+        "seconds": round(seconds, 2),
+        "workerCpuPercent": cpu_percent(worker_cpu, worker_cpu_end, seconds),
+        "loadgenCpuPercent": cpu_percent(own_cpu, own_cpu_end, seconds),
+        # The worker's own view from its last heartbeat, including its per-stage latency
+        "workerStatus": signaling.worker_status,
+    }
+    if args.output_mode == "video":
+        sent = sum(session["sent"] for session in accepted)
+        returned = sum(session["returned"] for session in accepted)
+        result.update({
+            "returnedFpsPerSession": round(returned / seconds / max(len(accepted), 1), 1),
+            "droppedRatio": round(1 - returned / sent, 4) if sent else None,
+            "latency": summarize([latency for client in clients for latency in client.latencies]),
+        })
+    else:
+        packets = sum(session["landmarkPackets"] for session in accepted)
+        result["landmarkFpsPerSession"] = round(packets / seconds / max(len(accepted), 1), 1)
+    result["perSession"] = sessions
+    return result
+
+
+def start_worker(args):
+    env = dict(os.environ)
+    env["SIGNALING_URL"] = f"http://{args.host}:{args.port}"
+    # Rejections at the worker's own limit are part of what is being measured, so keep any explicit limit
+    env.setdefault("MAX_CONCURRENT_SESSIONS", str(max(args.ramp)))
+    # Synthetic frames have nobody in them, and the idle policy would skip their inference or close the session
+    env.setdefault("NO_PERSON_FRAMES", "0")
+    env.setdefault("IDLE_SESSION_TIMEOUT", "0")
+    if args.pose_backend:
+        env["POSE_BACKEND"] = args.pose_backend
+    output = open(args.worker_log, "w") if args.worker_log else subprocess.DEVNULL
+    return subprocess.Popen([sys.executable, str(Path(__file__).with_name("mlModels.py"))],
+                            cwd=Path(__file__).parent, env=env, stdout=output, stderr=subprocess.STDOUT)
+
+
+async def run(args):
+    if args.video:
+        frames = video_frames(args.video, args.width, args.height, args.video_frames)
+    else:
+        frames = synthetic_frames(args.width, args.height)
+
+    signaling = FakeSignalingServer()
+    await signaling.start(args.host, args.port)
+    worker = None
+    if not args.no_spawn:
+        worker = start_worker(args)
+        args.worker_pid = worker.pid
+    try:
+        print(f"Waiting for a worker to register on http://{args.host}:{args.port} ...", file=sys.stderr)
+        await asyncio.wait_for(signaling.worker_connected.wait(), timeout=args.worker_timeout)
+        steps = []
+        for step, count in enumerate(args.ramp):
+            if not signaling.worker_connected.is_set():
+                raise SystemExit("The worker went away during the run.")
+            result = await run_step(signaling, frames, count, step, args)
+            steps.append(result)
+            if args.output_mode == "video":
+                latency = result["latency"] or {}
+                measured = f"p95 latency {latency.get('p95Ms')} ms, dropped {result['droppedRatio']}"
+            else:
+                measured = f"{result['landmarkFpsPerSession']} landmark packets/s per session"
+            print(f"{count} sessions: {result['accepted']} accepted, {measured}, "
+                  f"worker CPU {result['workerCpuPercent']}%", file=sys.stderr)
+            await asyncio.sleep(args.pause_seconds)
+    except asyncio.TimeoutError:
+        raise SystemExit(f"No worker registered within {args.worker_timeout} seconds.")
+    finally:
+        if worker is not None:
+            worker.terminate()
+            try:
+                worker.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        await signaling.stop()
+
+    return {
+        "settings": {
+            "resolution": f"{args.width}x{args.height}", "fps": args.fps,
+            "source": args.video or "synthetic", "outputMode": args.output_mode, "poseBackend": args.pose_backend,
+            "exercises": args.exercises, "cpus": os.cpu_count(),
+        },
+        "steps": steps,
+    }
+
+
+def parse_resolution(value):
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected WIDTHxHEIGHT, got '{value}'")
+    # Video encoders want even dimensions
+    return width - width % 2, height - height % 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent trainees against a local mlModels.py worker.")
+    parser.add_argument("--ramp", default="1,2,4", help="Comma-separated session counts, one step each")
+    parser.add_argument("--step-seconds", type=float, default=20.0, help="Measured time per step")
+    parser.add_argument("--settle-seconds", type=float, default=3.0, help="Unmeasured time after connecting")
+    parser.add_argument("--drain-seconds", type=float, default=1.0, help="Wait for frames in flight after a step")
+    parser.add_argument("--pause-seconds", type=float, default=2.0, help="Pause between steps")
+    parser.add_argument("--resolution", type=parse_resolution, default=(640, 480), help="Sent video size, e.g. 1280x720")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--video", help="Loop frames from this file instead of synthetic video")
+    parser.add_argument("--video-frames", type=int, default=150, help="Frames of --video held in memory and looped")
+    parser.add_argument("--output-mode", choices=("video", "landmarks"), default="video")
+    parser.add_argument("--pose-backend", help="Pose backend the sessions ask for; a spawned worker defaults to it")
+    parser.add_argument("--exercises", default="pushup", help="Comma-separated; sessions start on the first")
+    parser.add_argument("--exercise-change-seconds", type=float, default=0.0,
+                        help="Switch each session to the next of --exercises this often. 0 never switches")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055, help="Port of the stand-in signaling server")
+    parser.add_argument("--no-spawn", action="store_true",
+                        help="Wait for a worker started separately with SIGNALING_URL pointing here")
+    parser.add_argument("--worker-pid", type=int, help="With --no-spawn, the worker to measure CPU use of")
+    parser.add_argument("--worker-log", help="Write the spawned worker's output here")
+    parser.add_argument("--worker-timeout", type=float, default=120.0, help="Seconds to wait for the worker to register")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    args.ramp = [int(count) for count in args.ramp.split(",")]
+    args.exercises = args.exercises.split(",")
+    args.width, args.height = args.resolution
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
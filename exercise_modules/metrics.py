@@ -0,0 +1,166 @@
+import bisect
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds, from sub-millisecond work up to a stalled frame
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# Upper bounds for the number of frames run in one batched inference
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class StageTimer:
+    """
+    Cheap lap timer for the per-frame hot path: each lap() charges the time
+    since the previous lap to the named stage. `copied` counts the bytes of
+    image data the stages wrote into new buffers.
+    """
+
+    __slots__ = ("timings", "copied", "_last")
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.copied = 0
+        self._last = time.perf_counter()
+
+    def restart(self):
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self._last
+        self._last = now
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+Labels = Tuple[Tuple[str, str], ...]
+# A collector returns (metric name, labels, value) samples, read at scrape time
+Collector = Callable[[], List[Tuple[str, Dict[str, str], float]]]
+
+
+class MetricsRegistry:
+    """
+    Stage latency histograms per exercise type (kept for the life of the
+    worker) and per session (dropped when the session ends), rendered in the
+    Prometheus text format.
+    """
+
+    def __init__(self, prefix: str = "fittrack"):
+        self.prefix = prefix
+        self._stage_histograms: Dict[Labels, Histogram] = {}
+        self._session_histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._collectors: List[Collector] = []
+        self._histograms: List[Tuple[str, str, Histogram]] = []
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def add_histogram(self, name: str, help: str, histogram: Histogram):
+        """Renders a histogram another component observes into, such as the inference batch sizes."""
+        self._histograms.append((name, help, histogram))
+
+    def observe_frame(self, session_id: str, exercise_type: str, timings: Dict[str, float]):
+        session_histograms = self._session_histograms.setdefault(session_id, {})
+        for stage, seconds in timings.items():
+            key = (("exercise", exercise_type), ("stage", stage))
+            histogram = self._stage_histograms.get(key)
+            if histogram is None:
+                histogram = self._stage_histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+            key = (("session", session_id), ("stage", stage))
+            histogram = session_histograms.get(key)
+            if histogram is None:
+                histogram = session_histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def close_session(self, session_id: str):
+        self._session_histograms.pop(session_id, None)
+
+    def stage_totals(self) -> Dict[str, Tuple[int, float]]:
+        """Frames observed and total seconds per stage, over every exercise since the worker started."""
+        totals: Dict[str, Tuple[int, float]] = {}
+        for labels, histogram in self._stage_histograms.items():
+            stage = dict(labels)["stage"]
+            count, seconds = totals.get(stage, (0, 0.0))
+            totals[stage] = (count + histogram.count, seconds + histogram.total)
+        return totals
+
+    def stage_summary(self, since: Optional[Dict[str, Tuple[int, float]]] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Frames observed and mean seconds per stage since the worker started,
+        or only those observed after `since` was taken from stage_totals().
+        """
+        summary = {}
+        for stage, (count, seconds) in self.stage_totals().items():
+            if since is not None and stage in since:
+                count -= since[stage][0]
+                seconds -= since[stage][1]
+            if count > 0:
+                summary[stage] = {"count": count, "meanSeconds": seconds / count}
+        return summary
+
+    def render(self) -> str:
+        lines = []
+        name = f"{self.prefix}_stage_seconds"
+        lines.append(f"# HELP {name} Per-frame processing time by pipeline stage and exercise.")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in self._stage_histograms.items():
+            _render_histogram(lines, name, labels, histogram)
+
+        name = f"{self.prefix}_session_stage_seconds"
+        lines.append(f"# HELP {name} Per-frame processing time by pipeline stage for each live session.")
+        lines.append(f"# TYPE {name} histogram")
+        for histograms in self._session_histograms.values():
+            for labels, histogram in histograms.items():
+                _render_histogram(lines, name, labels, histogram)
+
+        for name, help, histogram in self._histograms:
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            _render_histogram(lines, name, (), histogram)
+
+        seen = set()
+        for collector in self._collectors:
+            for metric, labels, value in collector():
+                metric = f"{self.prefix}_{metric}"
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric}{_format_labels(tuple(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_histogram(lines: List[str], name: str, labels: Labels, histogram: Histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total}")
+    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
@@ -0,0 +1,69 @@
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from aiohttp import web
+
+from metrics import MetricsRegistry
+
+# Upper limit for on-demand profiles, so a request cannot tie up a thread for long
+MAX_PROFILE_SECONDS = 60
+
+
+def sample_profile(seconds: float, interval: float) -> str:
+    """
+    Samples the stacks of every other thread for `seconds` and returns them in
+    collapsed-stack format ("frame;frame;frame count"), ready for flame graph
+    tools. Runs on its own thread so the event loop is sampled while it works.
+    """
+    own_thread = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = collections.Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            frames = [f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                      for entry in traceback.extract_stack(frame)]
+            stacks[";".join([names.get(thread_id, str(thread_id))] + frames)] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+async def start_metrics_server(registry: MetricsRegistry, host: str, port: int) -> Optional[web.AppRunner]:
+    """
+    Serves /metrics in the Prometheus text format and /debug/profile, which
+    returns a sampling profile (?seconds=10&interval_ms=5).
+    """
+    async def metrics(request):
+        return web.Response(text=registry.render(), content_type="text/plain")
+
+    async def profile(request):
+        try:
+            seconds = min(float(request.query.get("seconds", "10")), MAX_PROFILE_SECONDS)
+            interval = float(request.query.get("interval_ms", "5")) / 1000.0
+        except ValueError:
+            raise web.HTTPBadRequest(text="seconds and interval_ms must be numbers")
+        loop = asyncio.get_running_loop()
+        stacks = await loop.run_in_executor(None, sample_profile, seconds, interval)
+        return web.Response(text=stacks, content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/debug/profile", profile)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        # Usually another worker on this host has the port; the worker runs fine without metrics
+        print(f"Metrics disabled: could not listen on {host}:{port} ({e}). Give each worker its own METRICS_PORT.")
+        await runner.cleanup()
+        return None
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
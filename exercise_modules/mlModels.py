@@ -1,121 +1,598 @@
+import time
+
+# Startup phases are timed from here, so the imports below are included
+STARTED = time.perf_counter()
+
 import asyncio
+import json
+import os
+import signal
+import socket
 import socketio
+from fractions import Fraction
 import cv2
 import numpy as np
-from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack, RTCIceCandidate
+from aiortc import RTCSessionDescription, MediaStreamTrack
 from aiortc.contrib.media import MediaRelay
+from aiortc.mediastreams import MediaStreamError
+from aiortc.sdp import candidate_from_sdp
 from av import VideoFrame
 
-from pushup import PushUpExerciseProcessor
-from crunch import CrunchExerciseProcessor
-from pullup import PullUpExerciseProcessor
-from squat import SquatExerciseProcessor
-from bicepcurl import BicepCurlExerciseProcessor
+from pose_estimation import draw_landmarks
+from sessions import SessionRegistry, SessionLimitError, OUTPUT_MODES
+from executors import create_executor, BatchInferenceExecutor
+from frames import LatestFrameReader
+from feedback import FeedbackEncoder, merge_feedback
+from recorder import create_session_recorder
+from exercise_recognition import ExerciseRecognizer
+from pose_backends import session_backends
+from metrics import MetricsRegistry, StageTimer
+from metrics_server import start_metrics_server
+from outbox import Outbox
+
+# Node.js signaling server this worker registers with
+SIGNALING_URL = os.environ.get("SIGNALING_URL", "http://localhost:5000")
+
+# Identifies this worker to the signaling server, which may route to several
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Seconds between load reports to the signaling server
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "5"))
+# On SIGTERM live sessions get this many seconds to finish before they are closed
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", "600"))
+
+# Maximum number of trainees this worker will serve at the same time
+MAX_CONCURRENT_SESSIONS = int(os.environ.get("MAX_CONCURRENT_SESSIONS", "4"))
+
+# Where pose inference runs: "thread", "process" or "batch" (frames of all sessions batched, see executors.py)
+INFERENCE_EXECUTOR = os.environ.get("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+# Pose graphs built per settings (and per worker process) before connecting
+POSE_WARM_UP_COUNT = int(os.environ.get("POSE_WARM_UP_COUNT", "1"))
+
+# "latest" skips stale frames when inference falls behind, "sequential" processes every frame
+FRAME_POLICY = os.environ.get("FRAME_POLICY", "latest")
+# Pose inference rate per session; frames in between reuse the last landmarks. 0 = every frame
+ANALYSIS_FPS = float(os.environ.get("ANALYSIS_FPS", "0"))
+
+# Landmark packets are skipped while this many bytes are still queued on a session's data channel
+DATA_CHANNEL_MAX_BUFFERED = int(os.environ.get("DATA_CHANNEL_MAX_BUFFERED", "65536"))
+
+# Seconds recv() waits for a client frame before sending a "signal lost" placeholder
+FRAME_TIMEOUT = float(os.environ.get("FRAME_TIMEOUT", "5"))
+# After this many analyzed frames in a row without a person, a session only looks for one
+# every NO_PERSON_PROBE_INTERVAL seconds and sends its video back untouched in between. 0 always analyzes
+NO_PERSON_FRAMES = int(os.environ.get("NO_PERSON_FRAMES", "30"))
+NO_PERSON_PROBE_INTERVAL = float(os.environ.get("NO_PERSON_PROBE_INTERVAL", "1.0"))
+# Opt-in: sessions with no frames, or nobody in them, for this many seconds are closed and their
+# pose model returned. Keep it well above a long rest between sets. 0 (the default) keeps them open
+IDLE_SESSION_TIMEOUT = float(os.environ.get("IDLE_SESSION_TIMEOUT", "0"))
+
+# Default for offers that do not say whether the exercise should be recognized automatically
+EXERCISE_RECOGNITION = os.environ.get("EXERCISE_RECOGNITION", "1") == "1"
+
+# The worker only registers once the p95 of a probe of pose inferences is under this. 0 skips the probe
+READY_LATENCY_TARGET_MS = float(os.environ.get("READY_LATENCY_TARGET_MS", "50"))
+# Inferences per probe, and probes before the worker registers anyway
+READY_PROBE_FRAMES = int(os.environ.get("READY_PROBE_FRAMES", "20"))
+READY_MAX_PROBES = int(os.environ.get("READY_MAX_PROBES", "5"))
+
+# Local HTTP endpoint for /metrics and /debug/profile. Port 0 disables it; when the port
+# is taken, e.g. by another worker on the same host, the worker runs without it
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
 
 sio = socketio.AsyncClient(logger=True, engineio_logger=True)
+# Session messages to Node go through here, so a slow link never holds up frames or offers
+outbox = Outbox(sio)
 
-pc = None
+executor = create_executor(INFERENCE_EXECUTOR, INFERENCE_WORKERS, POSE_WARM_UP_COUNT)
+metrics = MetricsRegistry()
+# Seconds spent in each startup phase, from imports to the first registration
+startup = StageTimer()
+startup.timings["imports"] = time.perf_counter() - STARTED
+
+def on_session_closed(session):
+    executor.release(session)
+    metrics.close_session(session.session_id)
+    # The whole rep timeline goes to the client in one message, for the workout it saves
+    outbox.send(session.session_id, "rep-log", {"to": session.session_id, **session.rep_log.to_dict()})
+
+sessions = SessionRegistry(max_sessions=MAX_CONCURRENT_SESSIONS, on_close=on_session_closed)
 relay = MediaRelay()
 
-def get_exercise_processor(exercise_type):
-    processors = {
-        "crunch": CrunchExerciseProcessor,
-        "pullup": PullUpExerciseProcessor,
-        "bicepcurl": BicepCurlExerciseProcessor,
-        "squat": SquatExerciseProcessor,
-        "pushup": PushUpExerciseProcessor
+def collect_worker_metrics():
+    samples = [
+        ("active_sessions", {}, len(sessions)),
+        ("max_sessions", {}, sessions.max_sessions),
+        ("executor_queue_depth", {}, executor.queue_depth()),
+        ("outbox_queue_depth", {}, outbox.depth()),
+    ]
+    pose_pool = getattr(executor, "pose_pool", None)
+    if pose_pool is not None:
+        # Process workers keep their estimators in their own processes, out of reach here
+        samples.append(("pose_pool_estimators", {"state": "idle"}, pose_pool.idle_count()))
+        samples.append(("pose_pool_estimators", {"state": "in_use"}, pose_pool.in_use_count()))
+    for (result, event), count in outbox.counts.items():
+        samples.append(("outbox_messages", {"result": result, "event": event}, count))
+    for worker_id, stats in executor.utilization().items():
+        samples.append(("executor_worker_utilization", {"worker": worker_id}, stats["utilization"]))
+    for phase, seconds in startup.timings.items():
+        samples.append(("startup_seconds", {"phase": phase}, seconds))
+    for session in sessions:
+        if session.video_track is not None:
+            for name, value in session.video_track.frame_stats().items():
+                samples.append(("session_frames", {"session": session.session_id, "kind": name}, value))
+    return samples
+
+metrics.add_collector(collect_worker_metrics)
+if isinstance(executor, BatchInferenceExecutor):
+    metrics.add_histogram("inference_batch_size", "Frames run through the pose model per batch.",
+                          executor.batch_sizes)
+
+# Set on SIGTERM: no new sessions, exit once the live ones end
+draining = False
+stopping = asyncio.Event()
+
+def worker_status(since=None):
+    """Registration and heartbeat payload. Stage latencies cover frames since `since` (metrics.stage_totals())."""
+    return {
+        "workerId": WORKER_ID,
+        "maxSessions": sessions.max_sessions,
+        "activeSessions": len(sessions),
+        "queueDepth": executor.queue_depth(),
+        "draining": draining,
+        "stages": metrics.stage_summary(since),
     }
-    return processors.get(exercise_type.lower(), PushUpExerciseProcessor)()
+
+async def send_heartbeats():
+    since = metrics.stage_totals()
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        status = worker_status(since)
+        since = metrics.stage_totals()
+        if sio.connected:
+            await sio.emit("worker-heartbeat", status)
+
+async def drain():
+    """
+    Stops taking sessions and tells the signaling server, which routes new
+    trainees to other workers; the worker exits once its sessions have ended
+    or DRAIN_TIMEOUT has passed.
+    """
+    global draining
+    if draining:
+        return
+    draining = True
+    print(f"Draining: waiting for {len(sessions)} active sessions to end.")
+    if sio.connected:
+        await sio.emit("worker-draining", worker_status())
+    deadline = asyncio.get_running_loop().time() + DRAIN_TIMEOUT
+    while len(sessions) and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(1)
+    if len(sessions):
+        print(f"Drain timeout reached, closing {len(sessions)} sessions.")
+        await sessions.close_all()
+    # Rep logs of the last sessions are still on their way to Node
+    await outbox.flush(5)
+    stopping.set()
+    if sio.connected:
+        await sio.disconnect()
+
+def landmark_packet(media_time, analysis, landmarks):
+    """
+    Data channel message for landmark-only sessions: the analysis plus x, y
+    and visibility for every landmark, flattened and rounded to keep it small.
+    """
+    packet = {**analysis, "time": media_time, "landmarks": None}
+    if landmarks is not None:
+        packet["landmarks"] = landmarks[:, [0, 1, 3]].round(4).ravel().tolist()
+    return json.dumps(packet, separators=(",", ":"))
+
+def coalesce_feedback(queued, latest):
+    return {**latest, "packet": merge_feedback(queued["packet"], latest["packet"])}
 
 class VideoProcessTrack(MediaStreamTrack):
+    """
+    Analyzes the client's video. In "video" output mode it is sent back as the
+    annotated stream; in "landmarks" mode it is never added to the peer
+    connection and stream_landmarks() pulls the frames instead.
+
+    Analysis rate limits and feedback coalescing follow the frames' media
+    time, so replaying a recording gives the same results at any speed.
+
+    With nobody in view for NO_PERSON_FRAMES analyzed frames, the session
+    goes idle: inference only runs every NO_PERSON_PROBE_INTERVAL and other
+    frames are neither decoded nor drawn on. A session idle, or without
+    frames, for IDLE_SESSION_TIMEOUT seconds is closed.
+    """
     kind = "video"
 
-    def __init__(self, track, exercise_type):
+    def __init__(self, track, session, frame_policy=FRAME_POLICY):
         super().__init__()
-        self.track = relay.subscribe(track)
-        self.processor = get_exercise_processor(exercise_type)
-        self.last_feedback_time = 0
+        self.track = track
+        if frame_policy == "latest":
+            self.track = LatestFrameReader(self.track)
+        self.session = session
+        self.feedback = FeedbackEncoder()
         self.frame_count = 0
+        self.analyzed_count = 0
+        self.reused_count = 0
+        self.last_analysis_time = None
+        self.last_analysis = {"repCount": 0, "position": None}
+        self.last_landmarks = None
+        self.first_frame_time = None
+        self.unsent_packets = 0
+        self.bytes_copied = 0
+        self.no_person_frames = 0
+        self.idle_frames = 0
+        # Event loop times of the last frame with a person in it and of the last frame at all
+        self.last_active = self.last_received = asyncio.get_event_loop().time()
+        self._closing = False
+        self._last_frame = None
+        self._placeholder = None
+        self._landmark_task = None
+
+    def frame_stats(self):
+        return {
+            "received": self.frame_count,
+            "dropped": getattr(self.track, "dropped", 0),
+            "analyzed": self.analyzed_count,
+            "reusedLandmarks": self.reused_count,
+            "unsentPackets": self.unsent_packets,
+            "idleFrames": self.idle_frames,
+            "feedbackMessages": self.feedback.sent,
+            # Image bytes written into new buffers: RGB conversion, inference crops and process hand-off
+            "bytesCopiedPerFrame": self.bytes_copied // max(self.frame_count, 1),
+        }
+
+    @property
+    def idle(self):
+        return NO_PERSON_FRAMES > 0 and self.no_person_frames >= NO_PERSON_FRAMES
+
+    def _should_analyze(self, now):
+        if self.last_analysis_time is None:
+            return True
+        if self.idle:
+            return now - self.last_analysis_time >= NO_PERSON_PROBE_INTERVAL
+        if ANALYSIS_FPS <= 0:
+            return True
+        return now - self.last_analysis_time >= 1.0 / ANALYSIS_FPS
+
+    def _check_idle(self):
+        if IDLE_SESSION_TIMEOUT <= 0 or self._closing:
+            return
+        now = asyncio.get_event_loop().time()
+        idle_seconds = now - self.last_active
+        if idle_seconds >= IDLE_SESSION_TIMEOUT:
+            self._closing = True
+            reason = "no-video" if now - self.last_received >= FRAME_TIMEOUT else "no-person"
+            asyncio.ensure_future(close_idle_session(self.session, idle_seconds, reason))
+
+    def _signal_lost_frame(self):
+        """
+        The "signal lost" placeholder, drawn once per session at the size of
+        its video, and stamped to follow the last frame sent.
+        """
+        last = self._last_frame
+        if self._placeholder is None:
+            width, height = (last.width, last.height) if last is not None else (640, 480)
+            image = np.zeros((height, width, 3), dtype=np.uint8)
+            cv2.putText(image, "Video signal lost...", (50, height // 2),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            # The encoder's own format, so it is not converted on every send
+            self._placeholder = VideoFrame.from_ndarray(image, format="rgb24").reformat(format="yuv420p")
+            self._placeholder.time_base = last.time_base if last is not None else Fraction(1, 90000)
+            self._placeholder.pts = last.pts if last is not None else 0
+        placeholder = self._placeholder
+        placeholder.pts += round(FRAME_TIMEOUT / placeholder.time_base)
+        return placeholder
 
-    def update_exercise(self, new_exercise_type):
-        print(f"Switching exercise processor to: {new_exercise_type}")
-        self.processor = get_exercise_processor(new_exercise_type)
+    async def _receive(self):
+        frame = await asyncio.wait_for(self.track.recv(), timeout=FRAME_TIMEOUT)
+        self.frame_count += 1
+        self.last_received = asyncio.get_event_loop().time()
+        if self.session.recorder is not None:
+            self.session.recorder.add_frame(frame)
+        return frame
+
+    @staticmethod
+    def _media_time(frame):
+        return frame.time if frame.time is not None else asyncio.get_event_loop().time()
+
+    def stop(self):
+        if self.readyState == "ended":
+            return
+        super().stop()
+        if self._landmark_task is not None:
+            self._landmark_task.cancel()
+        self.track.stop()
+        print(f"[{self.session.session_id}] Frame stats: {self.frame_stats()}")
+
+    def _decode(self, frame, timer):
+        """
+        Converts the frame to RGB, the only full-frame copy on the video path.
+        The array is a view of the returned frame, so what is drawn on it is
+        what gets encoded.
+        """
+        rgb_frame = frame.reformat(format="rgb24")
+        image = rgb_frame.to_ndarray()
+        timer.copied += image.nbytes
+        timer.lap("decode")
+        return rgb_frame, image
+
+    async def _analyze(self, frame, timer, now):
+        """
+        Runs inference on the frame, or reuses the last result between analyses.
+        Returns the RGB frame and its pixels (None in landmark mode when they
+        are not needed), the analysis and whether the frame was analyzed.
+        """
+        if self.first_frame_time is None:
+            self.first_frame_time = now
+        should_analyze = self._should_analyze(now)
+        if not should_analyze and (self.idle or not self.session.renders_video):
+            # Nothing to draw, so frames between analyses are not even decoded
+            self.reused_count += 1
+            if self.idle:
+                self.idle_frames += 1
+            return None, None, self.last_analysis, False
+
+        rgb_frame, image = self._decode(frame, timer)
+
+        if should_analyze:
+            # Pose estimation and analysis run off the event loop
+            analysis, self.last_landmarks, worker_timer = await executor.submit(self.session, image, now)
+            timer.lap("dispatch")
+            # Whatever the worker did not account for was spent queueing and handing off
+            timer.timings["dispatch"] = max(timer.timings["dispatch"] - sum(worker_timer.timings.values()), 0.0)
+            for stage, seconds in worker_timer.timings.items():
+                timer.timings[stage] = timer.timings.get(stage, 0.0) + seconds
+            timer.copied += worker_timer.copied
+            rep = analysis.pop("rep", None)
+            if rep is not None:
+                self.session.rep_log.add(self.session.exercise_type, now - self.first_frame_time, rep)
+            self.last_analysis = analysis
+            self.last_analysis_time = now
+            self.analyzed_count += 1
+            if self.last_landmarks is None:
+                self.no_person_frames += 1
+            else:
+                if self.idle and self.session.recognizer is not None:
+                    # Whoever steps back in may be doing something else, so recognize it afresh
+                    self.session.recognizer.reset()
+                self.no_person_frames = 0
+                self.last_active = asyncio.get_event_loop().time()
+            await self._recognize(timer)
+            return rgb_frame, image, analysis, True
+
+        # Between analyses, reuse the previous landmarks and state
+        self.reused_count += 1
+        return rgb_frame, image, self.last_analysis, False
+
+    async def _recognize(self, timer):
+        recognizer = self.session.recognizer
+        if recognizer is None:
+            return
+        exercise_type = recognizer.update(self.last_landmarks)
+        timer.lap("recognition")
+        if exercise_type is not None and exercise_type != self.session.exercise_type:
+            await switch_exercise(self.session, exercise_type, recognized=True)
+
+    def _finish_frame(self, timer):
+        self.bytes_copied += timer.copied
+        metrics.observe_frame(self.session.session_id, self.session.exercise_type, timer.timings)
+
+    def _send_feedback(self, analysis, timer, now):
+        packet = self.feedback.update(analysis, now)
+        if packet is None:
+            return
+        # Straight to the browser when it opened a feedback channel, otherwise relayed by Node
+        channel = self.session.feedback_channel
+        if channel is not None and channel.readyState == "open":
+            channel.send(packet)
+        else:
+            # Only the latest state matters, so a packet still queued is merged with this one
+            outbox.send(self.session.session_id, "exercise-feedback", {"to": self.session.session_id, "packet": packet},
+                        coalesce=coalesce_feedback)
+        timer.lap("emit")
 
     async def recv(self):
         try:
-            frame = await asyncio.wait_for(self.track.recv(), timeout=5.0)
+            frame = await self._receive()
         except asyncio.TimeoutError:
-            print("Timeout waiting for frame from client.")
-            blank_img = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(blank_img, "Video signal lost...", (50, 240),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            return VideoFrame.from_ndarray(blank_img, format="bgr24")
-
-        img = frame.to_ndarray(format="bgr24")
+            print(f"[{self.session.session_id}] Timeout waiting for frame from client.")
+            self._check_idle()
+            return self._signal_lost_frame()
 
-        processed_img, landmarks = self.processor.process_frame(img)
-        
-        # Analyze landmarks to get feedback
-        analysis = self.processor.analyze_exercise(landmarks)
+        timer = StageTimer()
+        now = self._media_time(frame)
+        rgb_frame, image, analysis, _ = await self._analyze(frame, timer, now)
+        self._check_idle()
+        if rgb_frame is None:
+            # Nobody in view: the client's frame goes back as it came
+            self._send_feedback(analysis, timer, now)
+            self._finish_frame(timer)
+            self._last_frame = frame
+            return frame
 
+        # Drawn straight into the outgoing frame
+        draw_landmarks(image, self.last_landmarks)
         rep_count = analysis.get('repCount', 0)
         position = analysis.get('position', 'unknown')
-        cv2.putText(processed_img, f"Reps: {rep_count}", (10, 30),
+        cv2.putText(image, f"Reps: {rep_count}", (10, 30),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
-        cv2.putText(processed_img, f"Position: {position}", (10, 70),
+        cv2.putText(image, f"Position: {position}", (10, 70),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 255), 2, cv2.LINE_AA)
+        timer.lap("overlay")
+
+        self._send_feedback(analysis, timer, now)
+
+        # aiortc's encoder converts the RGB frame to YUV itself, so it is sent as is
+        rgb_frame.pts = frame.pts
+        rgb_frame.time_base = frame.time_base
+        self._finish_frame(timer)
+        self._last_frame = rgb_frame
+        return rgb_frame
+
+    def start_landmark_stream(self):
+        self._landmark_task = asyncio.ensure_future(self.stream_landmarks())
 
-        # Send feedback over WebSocket periodically
-        current_time = asyncio.get_event_loop().time()
-        if current_time - self.last_feedback_time > 0.5: 
-            self.last_feedback_time = current_time
-            await sio.emit("exercise-feedback", analysis)
-
-        # Return the processed frame
-        new_frame = VideoFrame.from_ndarray(processed_img, format="bgr24")
-        new_frame.pts = frame.pts
-        new_frame.time_base = frame.time_base
-        return new_frame
-
-async def cleanup_pc():
-    global pc
-    if pc and pc.connectionState != "closed":
-        await pc.close()
-        pc = None
-        print("Previous PeerConnection closed.")
+    async def stream_landmarks(self):
+        """
+        Landmark-only output: consumes the client's video without sending any
+        back and streams each new analysis over the session's data channel,
+        so no frame is drawn on or re-encoded.
+        """
+        session_id = self.session.session_id
+        while self.readyState == "live":
+            try:
+                frame = await self._receive()
+            except asyncio.TimeoutError:
+                print(f"[{session_id}] Timeout waiting for frame from client.")
+                self._check_idle()
+                continue
+            except MediaStreamError:
+                break
+
+            timer = StageTimer()
+            now = self._media_time(frame)
+            _, _, analysis, analyzed = await self._analyze(frame, timer, now)
+            self._check_idle()
+            if analyzed:
+                self._send_landmarks(frame.time, analysis)
+                timer.lap("emit")
+            self._send_feedback(analysis, timer, now)
+            self._finish_frame(timer)
+
+    def _send_landmarks(self, media_time, analysis):
+        channel = self.session.landmark_channel
+        if channel is None or channel.readyState != "open":
+            return
+        # Only the newest landmarks matter, so a backed-up channel drops packets instead of queueing them
+        if channel.bufferedAmount > DATA_CHANNEL_MAX_BUFFERED:
+            self.unsent_packets += 1
+            return
+        channel.send(landmark_packet(media_time, analysis, self.last_landmarks))
+
+IDLE_MESSAGES = {
+    "no-video": "No video arrived for {seconds} seconds, so the session was closed.",
+    "no-person": "Nobody was in view for {seconds} seconds, so the session was closed.",
+}
+
+async def close_idle_session(session, idle_seconds, reason):
+    """
+    Closes an abandoned session, which returns its pose model and frees its
+    slot for another trainee. The client is told why before the connection
+    goes away.
+    """
+    print(f"[{session.session_id}] Idle for {idle_seconds:.0f}s ({reason}), closing the session.")
+    seconds = round(idle_seconds)
+    outbox.send(session.session_id, "session-idle", {"to": session.session_id, "idleSeconds": seconds,
+                                                     "reason": reason,
+                                                     "message": IDLE_MESSAGES[reason].format(seconds=seconds)})
+    await sessions.close(session.session_id, session)
+
+async def switch_exercise(session, exercise_type, recognized=False):
+    """
+    Swaps the session's rep counting. Recognized switches are announced to
+    the client; any other switch is the trainee's choice and ends recognition.
+    """
+    if not recognized:
+        session.recognizer = None
+    session.update_exercise(exercise_type)
+    executor.update_exercise(session)
+    if session.recognizer is not None:
+        # Frames of the previous exercise would otherwise vote to switch back
+        session.recognizer.reset()
+    event = "exercise-recognized" if recognized else "exercise-change"
+    if session.recorder is not None:
+        session.recorder.add_event(event, exerciseType=exercise_type)
+    if recognized:
+        outbox.send(session.session_id, "exercise-recognized",
+                    {"to": session.session_id, "exerciseType": exercise_type})
 
 @sio.event
 async def connect():
-    print("Connected to Node.js server.")
-    await sio.emit("connect-python")
+    print(f"Connected to Node.js server as worker {WORKER_ID}.")
+    await sio.emit("connect-python", worker_status())
+    if "connect" not in startup.timings:
+        startup.lap("connect")
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup.timings.items())
+        print(f"Worker ready {time.perf_counter() - STARTED:.2f}s after start ({phases}).")
 
 @sio.event
 async def disconnect():
     print("Disconnected from Node.js server.")
-    await cleanup_pc()
+    await sessions.close_all()
+
+def reject(session_id, message, retry=False):
+    """Turns an offer down; with `retry`, the signaling server tries another worker."""
+    outbox.send(session_id, "session-rejected", {"to": session_id, "message": message, "retry": retry})
 
 @sio.on("webrtc-offer")
 async def on_offer(data):
-    global pc
-    await cleanup_pc()
-
-    pc = RTCPeerConnection()
+    session_id = data.get("from")
     exercise_type = data.get("exerciseType", "pushup")
+    output_mode = data.get("outputMode", "video")
+    auto_exercise = bool(data.get("autoExercise", EXERCISE_RECOGNITION))
+    pose_backend = data.get("poseBackend") or session_backends()[0]
+    if output_mode not in OUTPUT_MODES:
+        reject(session_id, f"Unknown output mode '{output_mode}'.")
+        return
+    # Workers can offer different backends, so another one may take the session
+    if pose_backend not in session_backends():
+        reject(session_id, f"Pose backend '{pose_backend}' is not available.", retry=True)
+        return
+    # Capacity rejections are retried by the signaling server on another worker
+    if draining:
+        reject(session_id, "Worker is shutting down.", retry=True)
+        return
+
+    try:
+        session = await sessions.create(session_id, exercise_type, output_mode)
+    except SessionLimitError as e:
+        print(f"Rejecting session {session_id}: {e}")
+        reject(session_id, str(e), retry=True)
+        return
+    session.pose_backend = pose_backend
+    await executor.open_session(session)
+    if sessions.get(session_id) is not session:
+        # Closed while its estimator was being set up
+        executor.release(session)
+        return
+    if auto_exercise:
+        session.recognizer = ExerciseRecognizer()
+    session.recorder = create_session_recorder(session_id)
+    if session.recorder is not None:
+        session.recorder.add_event("session", exerciseType=exercise_type, outputMode=output_mode,
+                                   autoExercise=auto_exercise, poseBackend=pose_backend)
+
+    pc = session.pc
+    print(f"Session {session_id} started in {output_mode} mode with {pose_backend} "
+          f"({len(sessions)}/{sessions.max_sessions} active).")
 
     @pc.on("track")
     def on_track(track):
         if track.kind == "video":
-            print("Video track received from client.")
-            processed_track = VideoProcessTrack(track, exercise_type)
-            pc.addTrack(processed_track)
-            # Store track reference to allow updates
-            pc.video_processor_track = processed_track
-            
+            print(f"[{session_id}] Video track received from client.")
+            session.video_track = VideoProcessTrack(relay.subscribe(track), session)
+            if session.renders_video:
+                pc.addTrack(session.video_track)
+            else:
+                session.video_track.start_landmark_stream()
+
+    @pc.on("datachannel")
+    def on_datachannel(channel):
+        print(f"[{session_id}] Data channel '{channel.label}' opened by client.")
+        if channel.label == "pose":
+            session.landmark_channel = channel
+        elif channel.label == "feedback":
+            session.feedback_channel = channel
+
     @pc.on("connectionstatechange")
     async def on_connectionstatechange():
-        print(f"PC Connection State: {pc.connectionState}")
+        print(f"[{session_id}] PC Connection State: {pc.connectionState}")
         if pc.connectionState == "failed" or pc.connectionState == "closed":
-            await cleanup_pc()
+            await sessions.close(session_id, session)
 
     offer = RTCSessionDescription(sdp=data["sdp"], type=data["type"])
     await pc.setRemoteDescription(offer)
@@ -123,53 +600,96 @@ async def on_offer(data):
     answer = await pc.createAnswer()
     await pc.setLocalDescription(answer)
     
-    await sio.emit("webrtc-answer", {
+    outbox.send(session_id, "webrtc-answer", {
         "type": "answer", 
-        "sdp": pc.localDescription.sdp
+        "sdp": pc.localDescription.sdp,
+        "to": session_id
     })
 
-# --- CRITICAL FIX ---
 @sio.on("ice-candidate")
 async def on_ice_candidate(data):
-    if pc and data and data.get('candidate'):
+    session = sessions.get(data.get("from")) if data else None
+    if session and data.get('candidate'):
         try:
-            # Refactored: Construct RTCIceCandidate directly from the dictionary.
-            # No brittle string parsing needed. This is the correct way.
-            candidate = RTCIceCandidate(
-                sdpMid=data.get('sdpMid'),
-                sdpMLineIndex=data.get('sdpMLineIndex'),
-                candidate=data.get('candidate')
-            )
-            await pc.addIceCandidate(candidate)
+            # Browsers send the SDP attribute line, e.g. "candidate:1 1 udp 2122260223 ..."
+            candidate = candidate_from_sdp(data['candidate'].split(":", 1)[1])
+            candidate.sdpMid = data.get('sdpMid')
+            candidate.sdpMLineIndex = data.get('sdpMLineIndex')
+            await session.pc.addIceCandidate(candidate)
         except Exception as e:
-            print(f"Error adding ICE candidate: {e}")
+            print(f"[{session.session_id}] Error adding ICE candidate: {e}")
 
 @sio.on("client-disconnected")
-async def on_client_disconnected():
-    print("Client disconnected notification received.")
-    await cleanup_pc()
+async def on_client_disconnected(data=None):
+    session_id = data.get("from") if data else None
+    print(f"Client disconnected notification received for {session_id}.")
+    await sessions.close(session_id)
 
 @sio.on("exercise-change")
 async def on_exercise_change(data):
-    global pc
-    if pc and hasattr(pc, 'video_processor_track'):
-        new_exercise = data.get("exerciseType", "pushup")
-        pc.video_processor_track.update_exercise(new_exercise)
+    session = sessions.get(data.get("from"))
+    new_exercise = data.get("exerciseType", "pushup")
+    # Clients echo recognized switches back, which changes nothing
+    if session and new_exercise != session.exercise_type:
+        await switch_exercise(session, new_exercise)
+
+async def wait_until_ready() -> bool:
+    """
+    Probes pose inference on the executor's workers until its p95 meets
+    READY_LATENCY_TARGET_MS, so the worker does not take trainees while the
+    models and caches are still cold. Gives up after READY_MAX_PROBES.
+    """
+    for attempt in range(1, READY_MAX_PROBES + 1):
+        samples = await executor.probe(READY_PROBE_FRAMES)
+        p95 = {backend: np.percentile(seconds, 95) * 1e3 for backend, seconds in samples.items()}
+        slow = {backend: f"{ms:.1f} ms" for backend, ms in p95.items() if ms > READY_LATENCY_TARGET_MS}
+        if not slow:
+            print(f"Pose inference p95 {max(p95.values()):.1f} ms is within {READY_LATENCY_TARGET_MS} ms.")
+            return True
+        print(f"Probe {attempt}/{READY_MAX_PROBES}: p95 above {READY_LATENCY_TARGET_MS} ms for {slow}.")
+    print("Pose inference is still slower than the target; registering anyway.")
+    return False
 
 async def main():
-    while True:
+    startup.restart()
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = await start_metrics_server(metrics, METRICS_HOST, METRICS_PORT)
+        startup.lap("metrics-server")
+    print("Warming up pose estimators...")
+    await executor.warm_up()
+    startup.lap("warm-up")
+    if READY_LATENCY_TARGET_MS > 0:
+        await wait_until_ready()
+        startup.lap("readiness")
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(drain()))
+    except NotImplementedError:
+        pass  # No signal handlers on Windows event loops
+    heartbeats = asyncio.ensure_future(send_heartbeats())
+    sender = asyncio.ensure_future(outbox.run())
+    while not stopping.is_set():
         try:
-            await sio.connect("http://localhost:5000", socketio_path="/socket.io/")
+            await sio.connect(SIGNALING_URL, socketio_path="/socket.io/")
             await sio.wait()
         except socketio.exceptions.ConnectionError as e:
             print(f"Connection failed: {e}. Retrying in 10 seconds...")
-            await asyncio.sleep(10)
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                pass
         except asyncio.CancelledError:
             print("Main task cancelled.")
             break
         finally:
             if sio.connected:
                 await sio.disconnect()
+    heartbeats.cancel()
+    sender.cancel()
+    await sessions.close_all()
+    executor.shutdown()
+    if metrics_server is not None:
+        await metrics_server.cleanup()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# Messages one session may have waiting for the signaling server; beyond it the oldest is dropped
+OUTBOX_MAX_MESSAGES = int(os.environ.get("OUTBOX_MAX_MESSAGES", "32"))
+
+# Merges a queued message's data with a newer one's, for messages where only the latest state matters
+Coalesce = Callable[[Dict, Dict], Dict]
+
+
+class Outbox:
+    """
+    Per-session queues of socket.io messages for the signaling server,
+    drained by one background task, so a slow or reconnecting link to Node
+    never holds up a frame or an offer. Sessions take turns, one message
+    each. A message sent with `coalesce` is merged into a queued, unsent
+    message of the same event instead of queueing behind it, so a congested
+    link carries the latest state rather than a backlog. Messages queued
+    while the link is down are dropped, as its sessions end with it.
+    """
+
+    def __init__(self, sio, max_messages: int = OUTBOX_MAX_MESSAGES):
+        self.sio = sio
+        self.max_messages = max(max_messages, 1)
+        self._queues: Dict[str, Deque[List]] = {}
+        self._ready = asyncio.Event()
+        # Messages per (result, event), result being "sent", "coalesced" or "dropped"
+        self.counts: Dict[Tuple[str, str], int] = {}
+
+    def _count(self, result: str, event: str):
+        self.counts[(result, event)] = self.counts.get((result, event), 0) + 1
+
+    def send(self, session_id: str, event: str, data: Dict, coalesce: Optional[Coalesce] = None):
+        """Queues a message about a session without waiting for it to be sent."""
+        queue = self._queues.setdefault(session_id, deque())
+        if coalesce is not None:
+            for entry in queue:
+                if entry[0] == event and entry[2] is not None:
+                    entry[1] = coalesce(entry[1], data)
+                    self._count("coalesced", event)
+                    return
+        if len(queue) >= self.max_messages:
+            self._count("dropped", queue.popleft()[0])
+        queue.append([event, data, coalesce])
+        self._ready.set()
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def flush(self, timeout: float):
+        """Waits up to `timeout` seconds for the queued messages to go out."""
+        deadline = time.monotonic() + timeout
+        while self._queues and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def _emit(self, event: str, data: Dict):
+        if not self.sio.connected:
+            self._count("dropped", event)
+            return
+        try:
+            await self.sio.emit(event, data)
+            self._count("sent", event)
+        except Exception as e:
+            self._count("dropped", event)
+            print(f"Could not send '{event}' to the signaling server: {e}")
+
+    async def run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queues:
+                for session_id in list(self._queues):
+                    queue = self._queues.get(session_id)
+                    if not queue:
+                        continue
+                    # Taken off the queue before sending, so nothing merges into a message in flight
+                    event, data, _ = queue.popleft()
+                    if not queue:
+                        del self._queues[session_id]
+                    await self._emit(event, data)
@@ -0,0 +1,254 @@
+"""
+Pose estimation backends. Each turns an RGB image into a (NUM_LANDMARKS, 4)
+landmark array in the image's normalized coordinates, or None when nobody
+is found:
+
+    mediapipe-lite, mediapipe-full, mediapipe-heavy
+                    MediaPipe Pose at model complexity 0, 1 or 2, with its
+                    own tracking between frames
+    movenet-onnx    MoveNet single-pose on ONNX Runtime (POSE_ONNX_MODEL)
+    movenet-tflite  MoveNet single-pose on the LiteRT / TFLite interpreter,
+                    which runs it through XNNPACK (POSE_TFLITE_MODEL)
+
+MoveNet finds the 17 COCO keypoints. They cover every joint the exercise
+specs use; the other landmarks are reported with zero visibility. Its int8
+quantized releases run as they are, since input and output quantization are
+read from the model. The MoveNet runtimes are optional dependencies and are
+only imported when one of their backends is used.
+
+MoveNet holds no state between frames, so one estimator can serve many
+sessions: estimate_batch() runs several images in a single model call
+(see BatchInferenceExecutor).
+"""
+import os
+from functools import partial
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+import landmarks as lm
+
+# Backend used when a session does not ask for one
+POSE_BACKEND = os.environ.get("POSE_BACKEND", "")
+# 0 = lite, 1 = full, 2 = heavy; picks the MediaPipe default when POSE_BACKEND is not set
+POSE_MODEL_COMPLEXITY = int(os.environ.get("POSE_MODEL_COMPLEXITY", "1"))
+# Other backends a session may ask for in its offer, comma-separated
+POSE_SESSION_BACKENDS = os.environ.get("POSE_SESSION_BACKENDS", "")
+
+# MoveNet model files, e.g. movenet_singlepose_lightning_int8.tflite
+POSE_ONNX_MODEL = os.environ.get("POSE_ONNX_MODEL", "")
+POSE_TFLITE_MODEL = os.environ.get("POSE_TFLITE_MODEL", "")
+# Threads one MoveNet inference may use; the inference executor already runs sessions in parallel
+POSE_NUM_THREADS = int(os.environ.get("POSE_NUM_THREADS", "1"))
+# Mean keypoint score below which MoveNet is taken to have found nobody
+MOVENET_MIN_SCORE = float(os.environ.get("MOVENET_MIN_SCORE", "0.25"))
+
+MEDIAPIPE_BACKENDS = ("mediapipe-lite", "mediapipe-full", "mediapipe-heavy")
+# Stateless backends whose estimators take frames from any session, in batches
+BATCH_BACKENDS = ("movenet-onnx", "movenet-tflite")
+
+# Landmark index of each COCO keypoint in MoveNet's output order
+MOVENET_LANDMARKS = np.array([
+    lm.NOSE, lm.LEFT_EYE, lm.RIGHT_EYE, lm.LEFT_EAR, lm.RIGHT_EAR,
+    lm.LEFT_SHOULDER, lm.RIGHT_SHOULDER, lm.LEFT_ELBOW, lm.RIGHT_ELBOW, lm.LEFT_WRIST, lm.RIGHT_WRIST,
+    lm.LEFT_HIP, lm.RIGHT_HIP, lm.LEFT_KNEE, lm.RIGHT_KNEE, lm.LEFT_ANKLE, lm.RIGHT_ANKLE,
+], dtype=np.intp)
+
+
+class PoseBackendError(RuntimeError):
+    """Raised for an unknown pose backend, or one whose runtime or model is missing."""
+
+
+def landmarks_to_array(landmarks) -> np.ndarray:
+    """Packs MediaPipe landmarks into a (NUM_LANDMARKS, 4) x/y/z/visibility array."""
+    return np.array([(landmark.x, landmark.y, landmark.z, landmark.visibility) for landmark in landmarks],
+                    dtype=np.float32)
+
+
+class MediaPipePose:
+    _blank = np.zeros((256, 256, 3), dtype=np.uint8)
+
+    def __init__(self, model_complexity: int, min_detection_confidence: float, min_tracking_confidence: float):
+        import mediapipe as mp
+
+        self._pose = mp.solutions.pose.Pose(
+            model_complexity=model_complexity,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence
+        )
+
+    def estimate(self, image: np.ndarray) -> Optional[np.ndarray]:
+        results = self._pose.process(image)
+        return landmarks_to_array(results.pose_landmarks.landmark) if results.pose_landmarks else None
+
+    def reset(self):
+        self._pose.reset()
+        # MediaPipe restarts its graph on the first inference after a reset, which takes
+        # tens of milliseconds; a blank frame pays for it here, not the next session's first frame
+        self._pose.process(self._blank)
+
+    def close(self):
+        self._pose.close()
+
+
+def _onnx_runner(path: str):
+    try:
+        import onnxruntime
+    except ImportError:
+        raise PoseBackendError("movenet-onnx needs ONNX Runtime: pip install onnxruntime") from None
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = POSE_NUM_THREADS
+    options.inter_op_num_threads = 1
+    session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    dtypes = {"tensor(int32)": np.int32, "tensor(uint8)": np.uint8, "tensor(int8)": np.int8,
+              "tensor(float)": np.float32}
+    if model_input.type not in dtypes:
+        raise PoseBackendError(f"{path}: unsupported MoveNet input type {model_input.type}.")
+    size = model_input.shape[1] if isinstance(model_input.shape[1], int) else 192
+    name = model_input.name
+    # Exported models either take any batch size or exactly the one they were traced with
+    fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+
+    def run(tensor: np.ndarray) -> np.ndarray:
+        if fixed_batch is None or len(tensor) == fixed_batch:
+            return session.run(None, {name: tensor})[0]
+        return np.concatenate([session.run(None, {name: tensor[index:index + fixed_batch]})[0]
+                               for index in range(0, len(tensor), fixed_batch)])
+
+    # ONNX models carry quantization as graph nodes, so tensors are fed and read as plain values
+    return size, dtypes[model_input.type], (0.0, 0), run
+
+
+def _tflite_runner(path: str):
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            raise PoseBackendError("movenet-tflite needs LiteRT: pip install ai-edge-litert") from None
+    # XNNPACK is the interpreter's default CPU delegate for both float and int8 models
+    interpreter = Interpreter(model_path=path, num_threads=POSE_NUM_THREADS)
+    interpreter.allocate_tensors()
+    model_input = interpreter.get_input_details()[0]
+    model_output = interpreter.get_output_details()[0]
+    output_scale, output_zero_point = model_output["quantization"]
+    # Resizing reallocates every tensor, so each batch size gets its own interpreter
+    interpreters = {int(model_input["shape"][0]): interpreter}
+
+    def run(tensor: np.ndarray) -> np.ndarray:
+        interpreter = interpreters.get(len(tensor))
+        if interpreter is None:
+            interpreter = interpreters[len(tensor)] = Interpreter(model_path=path, num_threads=POSE_NUM_THREADS)
+            interpreter.resize_tensor_input(model_input["index"], tensor.shape)
+            interpreter.allocate_tensors()
+        interpreter.set_tensor(model_input["index"], tensor)
+        interpreter.invoke()
+        output = interpreter.get_tensor(model_output["index"])
+        if output_scale:
+            output = (output.astype(np.float32) - output_zero_point) * output_scale
+        return output
+
+    return int(model_input["shape"][1]), model_input["dtype"], model_input["quantization"], run
+
+
+MOVENET_RUNTIMES = {"onnx": (_onnx_runner, "POSE_ONNX_MODEL"), "tflite": (_tflite_runner, "POSE_TFLITE_MODEL")}
+
+
+class MoveNetPose:
+    """
+    MoveNet single-pose. It is stateless between frames; InferenceRegion's
+    crop around the last detection stands in for MediaPipe's tracking. The
+    MediaPipe confidence settings do not apply, MOVENET_MIN_SCORE does.
+    """
+
+    def __init__(self, runtime: str, min_detection_confidence: float = 0.5, min_tracking_confidence: float = 0.5,
+                 model_path: Optional[str] = None):
+        create_runner, setting = MOVENET_RUNTIMES[runtime]
+        model_path = model_path or {"onnx": POSE_ONNX_MODEL, "tflite": POSE_TFLITE_MODEL}[runtime]
+        if not model_path:
+            raise PoseBackendError(f"movenet-{runtime} needs a MoveNet model file in {setting}.")
+        if not os.path.exists(model_path):
+            raise PoseBackendError(f"MoveNet model {model_path} does not exist.")
+        self.size, self.dtype, (self.input_scale, self.input_zero_point), self._run = create_runner(model_path)
+        # Square model inputs, one row per image of a batch, reused between calls
+        self._input = np.zeros((1, self.size, self.size, 3), dtype=self.dtype)
+
+    def _prepare(self, image: np.ndarray, target: np.ndarray):
+        """Letterboxes the image at the top left of `target`. Returns its size there."""
+        height, width = image.shape[:2]
+        scale = self.size / max(height, width)
+        size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        resized = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        target[size[1]:] = 0
+        target[:size[1], size[0]:] = 0
+        if self.input_scale:
+            # Quantized input: pixel values are mapped onto the model's integer range
+            quantized = np.round(resized / self.input_scale + self.input_zero_point)
+            info = np.iinfo(self.dtype)
+            np.clip(quantized, info.min, info.max, out=quantized)
+            target[:size[1], :size[0]] = quantized
+        else:
+            target[:size[1], :size[0]] = resized
+        return size
+
+    def estimate(self, image: np.ndarray) -> Optional[np.ndarray]:
+        return self.estimate_batch([image])[0]
+
+    def estimate_batch(self, images) -> List[Optional[np.ndarray]]:
+        """Landmarks for each image, from one model call."""
+        if len(self._input) < len(images):
+            self._input = np.zeros((len(images), self.size, self.size, 3), dtype=self.dtype)
+        tensor = self._input[:len(images)]
+        sizes = [self._prepare(image, row) for image, row in zip(images, tensor)]
+        # (N, 1, 17, 3) of y, x and score, normalized to the square input
+        keypoints = np.asarray(self._run(tensor), dtype=np.float32).reshape(len(images), -1, 3)
+        return [self._landmarks(rows[:len(MOVENET_LANDMARKS)], size) for rows, size in zip(keypoints, sizes)]
+
+    def _landmarks(self, keypoints: np.ndarray, size) -> Optional[np.ndarray]:
+        width, height = size
+        if keypoints[:, 2].mean() < MOVENET_MIN_SCORE:
+            return None
+        landmarks = np.zeros((lm.NUM_LANDMARKS, 4), dtype=np.float32)
+        landmarks[MOVENET_LANDMARKS, lm.X] = keypoints[:, 1] * self.size / width
+        landmarks[MOVENET_LANDMARKS, lm.Y] = keypoints[:, 0] * self.size / height
+        landmarks[MOVENET_LANDMARKS, lm.VISIBILITY] = keypoints[:, 2]
+        return landmarks
+
+    def reset(self):
+        pass
+
+    def close(self):
+        self._run = None
+
+
+BACKENDS = {
+    "mediapipe-lite": partial(MediaPipePose, 0),
+    "mediapipe-full": partial(MediaPipePose, 1),
+    "mediapipe-heavy": partial(MediaPipePose, 2),
+    "movenet-onnx": partial(MoveNetPose, "onnx"),
+    "movenet-tflite": partial(MoveNetPose, "tflite"),
+}
+
+
+def default_backend() -> str:
+    return POSE_BACKEND or MEDIAPIPE_BACKENDS[POSE_MODEL_COMPLEXITY]
+
+
+def session_backends():
+    """Backends sessions may choose on this worker, the default first."""
+    backends = [default_backend()]
+    for name in POSE_SESSION_BACKENDS.split(","):
+        name = name.strip()
+        if name and name not in backends:
+            backends.append(name)
+    return backends
+
+
+def create_pose(backend: str, min_detection_confidence: float, min_tracking_confidence: float):
+    if backend not in BACKENDS:
+        raise PoseBackendError(f"Unknown pose backend '{backend}'. Expected one of {list(BACKENDS)}.")
+    return BACKENDS[backend](min_detection_confidence=min_detection_confidence,
+                             min_tracking_confidence=min_tracking_confidence)
@@ -0,0 +1,155 @@
+import os
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from landmarks import NUM_LANDMARKS, POSE_CONNECTIONS, X, Y, Z, VISIBILITY
+from metrics import StageTimer
+
+# Same look as mediapipe's drawing_utils defaults, in RGB like the frames they are drawn on
+LANDMARK_COLOR = (255, 0, 0)
+CONNECTION_COLOR = (224, 224, 224)
+BORDER_COLOR = (224, 224, 224)
+DRAW_VISIBILITY_THRESHOLD = 0.5
+
+# Longest side of the image handed to the pose model. 0 keeps the input size
+INFERENCE_MAX_SIZE = int(os.environ.get("INFERENCE_MAX_SIZE", "640"))
+# Crop to the person found in the previous frame once they are tracked
+ROI_CROPPING = os.environ.get("ROI_CROPPING", "1") == "1"
+# Margin around the tracked person, as a fraction of their bounding box
+ROI_PADDING = float(os.environ.get("ROI_PADDING", "0.3"))
+# Tracking counts as lost when fewer landmarks than this are visible
+ROI_MIN_VISIBLE_LANDMARKS = 8
+# Crops covering more than this fraction of the frame are not worth the copy
+ROI_MAX_AREA = 0.7
+
+
+class InferenceRegion:
+    """
+    Per-session inference resolution policy. Frames are downscaled so their
+    longest side is at most `max_size`, and once a person is tracked only a
+    padded box around their last landmarks is processed. The box only moves
+    when the person leaves it, which keeps MediaPipe's own tracking stable,
+    and full-frame detection resumes as soon as tracking is lost.
+    """
+
+    def __init__(self, max_size: int = INFERENCE_MAX_SIZE, crop: bool = ROI_CROPPING, padding: float = ROI_PADDING):
+        self.max_size = max_size
+        self.crop = crop
+        self.padding = padding
+        # Normalized (x0, y0, x1, y1) of the crop, None for the full frame
+        self.box: Optional[Tuple[float, float, float, float]] = None
+        self._buffer: Optional[np.ndarray] = None
+
+    def prepare(self, image: np.ndarray) -> Tuple[np.ndarray, Tuple[float, float, float, float]]:
+        """
+        Returns the image to run inference on and its normalized (x, y, width,
+        height) in the frame. A crop is a view of `image`; a downscaled image
+        is written into a buffer reused while the crop size stays the same.
+        """
+        height, width = image.shape[:2]
+        region = (0.0, 0.0, 1.0, 1.0)
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            left, top = int(x0 * width), int(y0 * height)
+            right, bottom = int(np.ceil(x1 * width)), int(np.ceil(y1 * height))
+            image = image[top:bottom, left:right]
+            region = (left / width, top / height, (right - left) / width, (bottom - top) / height)
+
+        longest = max(image.shape[:2])
+        if self.max_size and longest > self.max_size:
+            scale = self.max_size / longest
+            size = (max(int(image.shape[1] * scale), 1), max(int(image.shape[0] * scale), 1))
+            if self._buffer is None or self._buffer.shape[1::-1] != size:
+                self._buffer = np.empty((size[1], size[0], image.shape[2]), dtype=image.dtype)
+            image = cv2.resize(image, size, dst=self._buffer, interpolation=cv2.INTER_AREA)
+        return image, region
+
+    def update(self, landmarks: Optional[np.ndarray]):
+        if not self.crop:
+            return
+        if landmarks is None:
+            self.box = None
+            return
+        visible = landmarks[landmarks[:, VISIBILITY] > DRAW_VISIBILITY_THRESHOLD]
+        if len(visible) < ROI_MIN_VISIBLE_LANDMARKS:
+            self.box = None
+            return
+
+        x0, y0 = visible[:, X].min(), visible[:, Y].min()
+        x1, y1 = visible[:, X].max(), visible[:, Y].max()
+        if self.box is not None:
+            bx0, by0, bx1, by1 = self.box
+            if bx0 <= x0 and by0 <= y0 and x1 <= bx1 and y1 <= by1:
+                return
+
+        margin = self.padding * max(x1 - x0, y1 - y0)
+        box = (max(x0 - margin, 0.0), max(y0 - margin, 0.0), min(x1 + margin, 1.0), min(y1 + margin, 1.0))
+        if (box[2] - box[0]) * (box[3] - box[1]) > ROI_MAX_AREA:
+            box = None
+        self.box = box
+
+
+def prepare_inference(image: np.ndarray, timer: Optional[StageTimer] = None,
+                      region: Optional[InferenceRegion] = None):
+    """The image the pose model runs on, and its offset in the frame for finish_inference()."""
+    if region is None:
+        return image, None
+    prepared, offset = region.prepare(image)
+    if timer is not None:
+        if not np.may_share_memory(prepared, image):
+            timer.copied += prepared.nbytes
+        timer.lap("resize")
+    return prepared, offset
+
+
+def finish_inference(landmarks: Optional[np.ndarray], offset, region: Optional[InferenceRegion] = None):
+    """Maps landmarks found in a prepared image back to full-frame coordinates and updates the region."""
+    if landmarks is not None and offset is not None and offset != (0.0, 0.0, 1.0, 1.0):
+        left, top, width, height = offset
+        landmarks[:, X] = left + landmarks[:, X] * width
+        landmarks[:, Y] = top + landmarks[:, Y] * height
+        landmarks[:, Z] *= width
+    if region is not None:
+        region.update(landmarks)
+    return landmarks
+
+
+def estimate_pose(pose, image: np.ndarray, timer: Optional[StageTimer] = None,
+                  region: Optional[InferenceRegion] = None) -> Optional[np.ndarray]:
+    """
+    Runs the pose backend (see pose_backends.py) once on an RGB frame, which
+    may be a strided view. The resulting landmark array is what every
+    exercise analyzer consumes, so one inference can feed several. With a
+    region, inference runs on a smaller crop and the landmarks are mapped
+    back to full-frame coordinates.
+    """
+    image, offset = prepare_inference(image, timer, region)
+    landmarks = finish_inference(pose.estimate(image), offset, region)
+    if timer is not None:
+        timer.lap("inference")
+    return landmarks
+
+
+def draw_landmarks(image: np.ndarray, landmarks: Optional[np.ndarray]) -> np.ndarray:
+    if landmarks is None:
+        return image
+
+    height, width = image.shape[:2]
+    visible = landmarks[:, VISIBILITY] >= DRAW_VISIBILITY_THRESHOLD
+    points = np.empty((NUM_LANDMARKS, 2), dtype=np.int32)
+    points[:, 0] = np.minimum(np.floor(landmarks[:, X] * width), width - 1)
+    points[:, 1] = np.minimum(np.floor(landmarks[:, Y] * height), height - 1)
+    on_screen = visible & (landmarks[:, X] >= 0) & (landmarks[:, X] <= 1) & \
+        (landmarks[:, Y] >= 0) & (landmarks[:, Y] <= 1)
+
+    pixels = [tuple(point) for point in points.tolist()]
+    for start, end in POSE_CONNECTIONS:
+        if on_screen[start] and on_screen[end]:
+            cv2.line(image, pixels[start], pixels[end], CONNECTION_COLOR, 2)
+    for index in np.flatnonzero(on_screen):
+        center = pixels[index]
+        cv2.circle(image, center, 3, BORDER_COLOR, 2)
+        cv2.circle(image, center, 2, LANDMARK_COLOR, 2)
+    return image
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from pose_backends import create_pose, default_backend
+
+PoseKey = Tuple[str, float, float]
+
+_BLANK = np.zeros((256, 256, 3), dtype=np.uint8)
+
+
+class PoseEstimatorPool:
+    """
+    Keeps pose estimators alive between sessions. Building a MediaPipe graph
+    takes hundreds of milliseconds, so sessions check one out when they start,
+    keep it across exercise switches and return it when they end. Estimators
+    are pooled per backend and settings; `backend` is the one used when a
+    checkout does not name one. New estimators run one dummy inference before
+    they are handed out, since the first inference also initializes the graph.
+    """
+
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = backend or default_backend()
+        self._idle: Dict[PoseKey, List] = {}
+        self._keys: Dict[int, PoseKey] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _key(self, min_detection_confidence: float, min_tracking_confidence: float,
+             backend: Optional[str]) -> PoseKey:
+        return (backend or self.backend, min_detection_confidence, min_tracking_confidence)
+
+    def _create(self, key: PoseKey):
+        pose = create_pose(*key)
+        pose.estimate(_BLANK)
+        self.created += 1
+        return pose
+
+    def checkout(self, min_detection_confidence: float, min_tracking_confidence: float, backend: Optional[str] = None):
+        key = self._key(min_detection_confidence, min_tracking_confidence, backend)
+        with self._lock:
+            idle = self._idle.get(key)
+            pose = idle.pop() if idle else None
+        if pose is None:
+            pose = self._create(key)
+        with self._lock:
+            self._keys[id(pose)] = key
+        return pose
+
+    def checkin(self, pose):
+        with self._lock:
+            key = self._keys.pop(id(pose), None)
+        if key is None:
+            return
+        # Clear tracking state so the next session starts with a fresh detection
+        pose.reset()
+        with self._lock:
+            self._idle.setdefault(key, []).append(pose)
+
+    def warm_up(self, min_detection_confidence: float, min_tracking_confidence: float, count: int = 1,
+                backend: Optional[str] = None):
+        """Builds `count` estimators ahead of time."""
+        key = self._key(min_detection_confidence, min_tracking_confidence, backend)
+        poses = [self._create(key) for _ in range(count)]
+        with self._lock:
+            self._idle.setdefault(key, []).extend(poses)
+
+    def probe(self, min_detection_confidence: float, min_tracking_confidence: float, count: int,
+              backend: Optional[str] = None, size: Tuple[int, int] = (640, 480)) -> List[float]:
+        """
+        Seconds each of `count` inferences on `size` noise frames takes on a
+        pooled estimator. Nobody is found in noise, so every frame takes the
+        detection path.
+        """
+        frame = np.random.default_rng(0).integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        pose = self.checkout(min_detection_confidence, min_tracking_confidence, backend)
+        samples = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                pose.estimate(frame)
+                samples.append(time.perf_counter() - started)
+        finally:
+            self.checkin(pose)
+        return samples
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return sum(len(poses) for poses in self._idle.values())
+
+    def in_use_count(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for poses in idle.values():
+            for pose in poses:
+                pose.close()
@@ -0,0 +1,27 @@
+import os
+
+from exercise_engine import load_exercises
+
+# Exercise specs compiled at import; see exercise_engine.py for the format
+EXERCISE_SPEC_DIR = os.environ.get("EXERCISE_SPEC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exercises"))
+
+PROCESSORS = load_exercises(EXERCISE_SPEC_DIR)
+DEFAULT_EXERCISE = "pushup"
+
+def get_processor_class(exercise_type):
+    processor_class = PROCESSORS.get(exercise_type.lower())
+    if processor_class is None:
+        print(f"Unknown exercise type '{exercise_type}', analyzing it as {DEFAULT_EXERCISE}.")
+        return PROCESSORS[DEFAULT_EXERCISE]
+    return processor_class
+
+def get_exercise_processor(exercise_type):
+    return get_processor_class(exercise_type)()
+
+def pose_option_sets():
+    """The distinct pose estimator settings used by the supported exercises."""
+    options = []
+    for processor_class in PROCESSORS.values():
+        if processor_class.POSE_OPTIONS not in options:
+            options.append(processor_class.POSE_OPTIONS)
+    return options
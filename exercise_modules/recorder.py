@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from fractions import Fraction
+from pathlib import Path
+from typing import Optional
+
+import av
+
+# Sessions are recorded here when set, one directory per session. Empty disables recording
+RECORD_SESSIONS_DIR = os.environ.get("RECORD_SESSIONS_DIR", "")
+# Frames waiting for the writer thread; newer frames are dropped once this many are queued
+RECORD_MAX_QUEUED_FRAMES = int(os.environ.get("RECORD_MAX_QUEUED_FRAMES", "60"))
+RECORD_CODEC = os.environ.get("RECORD_CODEC", "libx264")
+
+VIDEO_FILE = "video.mkv"
+EVENTS_FILE = "events.jsonl"
+# Recorded video timestamps, matching the RTP video clock
+TIME_BASE = Fraction(1, 90000)
+
+
+class SessionRecorder:
+    """
+    Records one session's incoming video and its events for replay.py.
+
+    add_frame and add_event only append to an in-memory queue, so the event
+    loop never waits on the disk or the encoder; a writer thread encodes the
+    frames into VIDEO_FILE and appends the events to EVENTS_FILE. At most
+    `max_queued_frames` frames are held, further ones are dropped, and each
+    run of drops is logged as one "dropped" event with its count. Once the
+    writer fails, input is ignored. Event times are media times relative to
+    the first recorded frame, the same clock as the recorded video.
+    """
+
+    def __init__(self, directory, max_queued_frames: int = RECORD_MAX_QUEUED_FRAMES, codec: str = RECORD_CODEC):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_queued_frames = max_queued_frames
+        self.codec = codec
+        self.recorded = 0
+        self.dropped = 0
+        self._queue = deque()
+        self._queued_frames = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        # Set when the writer thread stops on an error
+        self.failed = False
+        # Frames dropped since the last queued one, and the media time of the first of them
+        self._dropped_run = 0
+        self._dropped_since = 0.0
+        self._first_time = None
+        self._last_time = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{self.directory.name}")
+        self._thread.start()
+
+    def _media_time(self) -> float:
+        return self._last_time - self._first_time if self._first_time is not None else 0.0
+
+    def _queue_dropped(self):
+        # Called with the condition held
+        if self._dropped_run and not self.failed:
+            self._queue.append(("event", {"type": "dropped", "time": self._dropped_since, "count": self._dropped_run}))
+            self._dropped_run = 0
+
+    def add_frame(self, frame: av.VideoFrame):
+        if self._closed or self.failed or frame.pts is None:
+            return
+        if self._first_time is None:
+            self._first_time = frame.time
+        self._last_time = frame.time
+        with self._condition:
+            if self._queued_frames >= self.max_queued_frames:
+                self.dropped += 1
+                if not self._dropped_run:
+                    self._dropped_since = self._media_time()
+                self._dropped_run += 1
+                return
+            self._queue_dropped()
+            self._queued_frames += 1
+            self._queue.append(("frame", frame))
+            self._condition.notify()
+
+    def add_event(self, kind: str, **fields):
+        """Events are small and never dropped."""
+        if self._closed or self.failed:
+            return
+        event = {"type": kind, "time": self._media_time(), "wallTime": time.time(), **fields}
+        with self._condition:
+            self._queue.append(("event", event))
+            self._condition.notify()
+
+    def close(self):
+        """Stops taking input; the writer thread flushes what is queued and finalizes the files."""
+        with self._condition:
+            self._closed = True
+            self._queue_dropped()
+            self._condition.notify()
+
+    def _run(self):
+        container = stream = None
+        first_pts = last_pts = None
+        with open(self.directory / EVENTS_FILE, "w") as events:
+            try:
+                while True:
+                    with self._condition:
+                        while not self._queue and not self._closed:
+                            self._condition.wait()
+                        if not self._queue:
+                            break
+                        kind, item = self._queue.popleft()
+                        if kind == "frame":
+                            self._queued_frames -= 1
+
+                    if kind == "event":
+                        events.write(json.dumps(item) + "\n")
+                        events.flush()
+                        continue
+
+                    if container is None:
+                        container = av.open(str(self.directory / VIDEO_FILE), "w")
+                        stream = self._add_stream(container, item.width, item.height)
+                        first_pts = item.pts
+                    # The pts of the RTP clock starts at a random offset; recordings start at 0
+                    pts = int((item.pts - first_pts) * item.time_base / TIME_BASE)
+                    if last_pts is not None and pts <= last_pts:
+                        continue
+                    last_pts = pts
+                    # WebRTC changes resolution with bandwidth; the recording keeps the first size
+                    frame = item.reformat(width=stream.width, height=stream.height, format="yuv420p")
+                    frame.pts = pts
+                    frame.time_base = TIME_BASE
+                    for packet in stream.encode(frame):
+                        container.mux(packet)
+                    self.recorded += 1
+            except Exception as e:
+                print(f"Recording to {self.directory} failed: {e}")
+                # Nothing will take what is queued any more, so let it go and refuse more
+                with self._condition:
+                    self.failed = True
+                    self._queue.clear()
+                    self._queued_frames = 0
+            finally:
+                if container is not None:
+                    try:
+                        # The stream is missing when setting it up was what failed
+                        if stream is not None:
+                            for packet in stream.encode():
+                                container.mux(packet)
+                    except Exception as e:
+                        print(f"Finishing the recording in {self.directory} failed: {e}")
+                    finally:
+                        container.close()
+
+    def _add_stream(self, container, width: int, height: int):
+        codec = self.codec if self.codec in av.codecs_available else "mpeg4"
+        stream = container.add_stream(codec, rate=30)
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = "yuv420p"
+        stream.time_base = TIME_BASE
+        # MPEG-4 Part 2 takes no time base finer than 1/65535 s; frames are rescaled to it on encode
+        stream.codec_context.time_base = TIME_BASE if codec != "mpeg4" else Fraction(1, 30000)
+        if codec == "libx264":
+            # Recording must keep up with live sessions, so favour speed over size
+            stream.options = {"preset": "ultrafast", "crf": "18"}
+        return stream
+
+
+def create_session_recorder(session_id: str) -> Optional[SessionRecorder]:
+    if not RECORD_SESSIONS_DIR:
+        return None
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{session_id}"
+    return SessionRecorder(Path(RECORD_SESSIONS_DIR) / name)
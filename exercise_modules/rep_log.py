@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+# Rep events are appended here when set, one JSONL file per session. Empty keeps them in memory only
+REP_LOG_DIR = os.environ.get("REP_LOG_DIR", "")
+# Reps buffered before they are appended to the file; the rest are written when the session ends
+REP_LOG_BATCH_SIZE = int(os.environ.get("REP_LOG_BATCH_SIZE", "20"))
+
+REP_DTYPE = np.dtype([
+    ("exercise", np.uint8),         # index into RepLog.exercises
+    ("time", np.float32),           # seconds from the session's first frame to the end of the rep
+    ("duration", np.float32),       # seconds the rep took
+    ("min_angle", np.float32),      # count angle range over the rep, in degrees
+    ("max_angle", np.float32),
+    ("posture_failures", np.uint16),  # analyzed frames in the rep where the posture gate failed
+])
+# Wire and file names of the REP_DTYPE fields
+FIELD_NAMES = {"exercise": "exercise", "time": "time", "duration": "duration",
+               "min_angle": "minAngle", "max_angle": "maxAngle", "posture_failures": "postureFailures"}
+
+
+class RepLog:
+    """
+    Timeline of one session's completed reps, kept in a growing structured
+    array so the hot path only writes one row per rep. With REP_LOG_DIR set,
+    rows are appended to the session's file every `batch_size` reps and on
+    close(); to_dict() gives the whole timeline as columns for a single
+    message at the end of the session.
+    """
+
+    def __init__(self, session_id: str, directory: str = REP_LOG_DIR, batch_size: int = REP_LOG_BATCH_SIZE):
+        self.session_id = session_id
+        self.started = time.time()
+        self.exercises = []
+        self.batch_size = max(batch_size, 1)
+        self.path: Optional[Path] = None
+        if directory:
+            self.path = Path(directory) / f"{time.strftime('%Y%m%d-%H%M%S')}-{session_id}.jsonl"
+        self._rows = np.zeros(32, dtype=REP_DTYPE)
+        self._count = 0
+        self._flushed = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, exercise: str, elapsed: float, rep: Dict):
+        """Records a rep event from ExerciseProcessor.analyze_exercise that ended `elapsed` seconds into the session."""
+        if exercise not in self.exercises:
+            self.exercises.append(exercise)
+        if self._count == len(self._rows):
+            self._rows = np.resize(self._rows, 2 * len(self._rows))
+        self._rows[self._count] = (self.exercises.index(exercise), elapsed, rep["duration"],
+                                   rep["minAngle"], rep["maxAngle"], min(rep["postureFailures"], 0xFFFF))
+        self._count += 1
+        if self.path is not None and self._count - self._flushed >= self.batch_size:
+            self.flush()
+
+    def _records(self, start: int, stop: int):
+        rows = self._rows[start:stop]
+        columns = {FIELD_NAMES[name]: rows[name].tolist() for name in REP_DTYPE.names}
+        columns["exercise"] = [self.exercises[index] for index in columns["exercise"]]
+        for name in ("time", "duration", "minAngle", "maxAngle"):
+            columns[name] = [round(value, 3) for value in columns[name]]
+        return columns
+
+    def flush(self):
+        """Appends the reps not written yet to the session's file, in one write."""
+        if self.path is None or self._flushed == self._count:
+            return
+        columns = self._records(self._flushed, self._count)
+        lines = []
+        for index in range(self._count - self._flushed):
+            record = {name: values[index] for name, values in columns.items()}
+            lines.append(json.dumps({"session": self.session_id, **record}, separators=(",", ":")))
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"[{self.session_id}] Could not write rep log {self.path}: {e}")
+        self._flushed = self._count
+
+    def to_dict(self) -> Dict:
+        """Every rep as columns, for one message at the end of the session."""
+        return {"startedAt": self.started, "count": self._count, "reps": self._records(0, self._count)}
+
+    def close(self):
+        self.flush()
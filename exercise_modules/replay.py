@@ -0,0 +1,203 @@
+"""
+Replays recorded sessions through the live inference pipeline.
+
+    RECORD_SESSIONS_DIR=recordings python mlModels.py    # record live sessions
+    python replay.py recordings/20250101-120000-abc --expect-reps 12
+    python replay.py recordings/* --concurrency 4 --output replay.json
+
+Each recording is fed through VideoProcessTrack with the same executor,
+smoothing and analyzers mlModels.py runs, and the exercise changes are
+applied at their recorded times. Frames are read as fast as the pipeline
+takes them unless --realtime is given, and analysis follows the recorded
+media time, so results match the live session at any speed.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import av
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+import mlModels
+from feedback import decode_feedback
+from recorder import VIDEO_FILE, EVENTS_FILE
+from sessions import SessionLimitError
+
+
+def load_events(recording: Path):
+    with open(recording / EVENTS_FILE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayTrack(MediaStreamTrack):
+    """A recorded video as a track. `on_time` is awaited with each frame's time before it is returned."""
+
+    kind = "video"
+
+    def __init__(self, path: Path, on_time=None, realtime: bool = False):
+        super().__init__()
+        self.container = av.open(str(path))
+        self.frames = self.container.decode(video=0)
+        self.on_time = on_time
+        self.realtime = realtime
+        self._started = None
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        try:
+            frame = next(self.frames)
+        except StopIteration:
+            self.stop()
+            raise MediaStreamError
+        if self.realtime:
+            if self._started is None:
+                self._started = time.perf_counter() - frame.time
+            await asyncio.sleep(max(self._started + frame.time - time.perf_counter(), 0.0))
+        if self.on_time is not None:
+            await self.on_time(frame.time)
+        return frame
+
+    def stop(self):
+        if self.readyState == "live":
+            super().stop()
+            self.container.close()
+
+
+class CaptureChannel:
+    """Stands in for a data channel and keeps what the pipeline sends to the client."""
+
+    readyState = "open"
+    bufferedAmount = 0
+
+    def __init__(self, decode=None):
+        self.decode = decode
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(self.decode(message) if self.decode else message)
+
+
+async def replay_session(recording: Path, session_id: str, realtime: bool, pose_backend=None):
+    events = load_events(recording)
+    start = next((event for event in events if event["type"] == "session"), {})
+    changes = [event for event in events if event["type"] == "exercise-change"]
+
+    session = await mlModels.sessions.create(session_id, start.get("exerciseType", "pushup"),
+                                             start.get("outputMode", "video"))
+    session.pose_backend = pose_backend or start.get("poseBackend")
+    await mlModels.executor.open_session(session)
+    # Recognized switches are not replayed from the log, the recognizer makes them again
+    if start.get("autoExercise"):
+        session.recognizer = mlModels.ExerciseRecognizer()
+    session.feedback_channel = CaptureChannel(decode_feedback)
+    session.landmark_channel = CaptureChannel()
+
+    last_time = [0.0]
+
+    async def apply_changes(media_time):
+        last_time[0] = media_time
+        while changes and changes[0]["time"] <= media_time:
+            exercise_type = changes.pop(0)["exerciseType"]
+            if exercise_type != session.exercise_type:
+                await mlModels.switch_exercise(session, exercise_type)
+
+    track = mlModels.VideoProcessTrack(
+        ReplayTrack(recording / VIDEO_FILE, apply_changes, realtime), session,
+        frame_policy="latest" if realtime else "sequential",
+    )
+    session.video_track = track
+    started = time.perf_counter()
+    try:
+        if session.renders_video:
+            while True:
+                try:
+                    await track.recv()
+                except MediaStreamError:
+                    break
+        else:
+            await track.stream_landmarks()
+    finally:
+        elapsed = time.perf_counter() - started
+        stats = track.frame_stats()
+        await mlModels.sessions.close(session_id, session)
+
+    feedback = {}
+    for message in session.feedback_channel.messages:
+        feedback.update(message)
+    return {
+        "recording": str(recording),
+        "session": session_id,
+        "exerciseType": session.exercise_type,
+        "outputMode": session.output_mode,
+        "poseBackend": session.pose_backend or mlModels.session_backends()[0],
+        "repCount": track.last_analysis.get("repCount", 0),
+        "position": track.last_analysis.get("position"),
+        "frames": stats,
+        "feedbackMessages": len(session.feedback_channel.messages),
+        "repLog": session.rep_log.to_dict()["reps"],
+        "lastFeedback": feedback,
+        "seconds": round(elapsed, 3),
+        "fps": round(stats["received"] / max(elapsed, 1e-9), 1),
+        "speedup": round(last_time[0] / max(elapsed, 1e-9), 2),
+        "droppedWhileRecording": sum(event["type"] == "dropped" for event in events),
+        "recognizedWhileRecording": [event["exerciseType"] for event in events if event["type"] == "exercise-recognized"],
+    }
+
+
+async def run(args):
+    recordings = [Path(path) for path in args.recordings]
+    for recording in recordings:
+        if not (recording / VIDEO_FILE).exists():
+            raise SystemExit(f"{recording} is not a recording: {VIDEO_FILE} is missing.")
+
+    mlModels.sessions.max_sessions = max(mlModels.sessions.max_sessions, args.concurrency)
+    await mlModels.executor.warm_up()
+    results = []
+    try:
+        for recording in recordings:
+            try:
+                results.extend(await asyncio.gather(*[
+                    replay_session(recording, f"replay-{recording.name}-{index}", args.realtime, args.pose_backend)
+                    for index in range(args.concurrency)
+                ]))
+            except SessionLimitError as e:
+                raise SystemExit(str(e))
+    finally:
+        mlModels.executor.shutdown()
+    return {"results": results, "stages": mlModels.metrics.stage_summary()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions through the inference pipeline.")
+    parser.add_argument("recordings", nargs="+", help="Session directories written with RECORD_SESSIONS_DIR")
+    parser.add_argument("--concurrency", type=int, default=1, help="Copies of each recording replayed at once")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Pace frames at the recorded rate and drop stale ones, like a live session")
+    parser.add_argument("--pose-backend", help="Replay with this pose backend instead of the recorded one")
+    parser.add_argument("--expect-reps", type=int, help="Exit with status 1 if any replay counts a different number of reps")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.expect_reps is not None:
+        failed = [result for result in report["results"] if result["repCount"] != args.expect_reps]
+        for result in failed:
+            print(f"{result['session']}: expected {args.expect_reps} reps, counted {result['repCount']}", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
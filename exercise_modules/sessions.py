@@ -0,0 +1,107 @@
+from typing import Callable, Dict, Optional
+
+from aiortc import RTCPeerConnection
+
+from rep_log import RepLog
+
+
+class SessionLimitError(Exception):
+    """Raised when a new session would exceed the worker's session limit."""
+
+
+# "video" sends back the annotated video, "landmarks" only sends landmark and
+# analysis packets over a data channel and leaves drawing to the client
+OUTPUT_MODES = ("video", "landmarks")
+
+
+class InferenceSession:
+    """Everything the worker holds for one trainee, keyed by their socket id."""
+
+    def __init__(self, session_id: str, exercise_type: str, output_mode: str = "video"):
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode '{output_mode}'. Expected one of {list(OUTPUT_MODES)}.")
+        self.session_id = session_id
+        self.exercise_type = exercise_type
+        self.output_mode = output_mode
+        # Pose backend from pose_backends.py, None for the worker's default
+        self.pose_backend = None
+        # Set by the inference executor when it runs processors in this process
+        self.pose = None
+        self.processor = None
+        self.region = None
+        self.smoother = None
+        # ExerciseRecognizer when the exercise is recognized from the trainee's movement
+        self.recognizer = None
+        self.pc = RTCPeerConnection()
+        self.video_track = None
+        self.recorder = None
+        self.rep_log = RepLog(session_id)
+        # Data channels the client may open: "pose" for landmark packets, "feedback" for feedback messages
+        self.landmark_channel = None
+        self.feedback_channel = None
+
+    @property
+    def renders_video(self) -> bool:
+        return self.output_mode == "video"
+
+    def update_exercise(self, exercise_type: str):
+        print(f"[{self.session_id}] Switching exercise processor to: {exercise_type}")
+        self.exercise_type = exercise_type
+
+    async def close(self):
+        if self.video_track is not None:
+            self.video_track.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.rep_log.close()
+        if self.pc.connectionState != "closed":
+            await self.pc.close()
+        print(f"[{self.session_id}] PeerConnection closed.")
+
+
+class SessionRegistry:
+    def __init__(self, max_sessions: int, on_close: Optional[Callable[[InferenceSession], None]] = None):
+        self.max_sessions = max_sessions
+        self.on_close = on_close
+        self._sessions: Dict[str, InferenceSession] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def get(self, session_id: Optional[str]) -> Optional[InferenceSession]:
+        if session_id is None:
+            return None
+        return self._sessions.get(session_id)
+
+    def is_full(self) -> bool:
+        return len(self._sessions) >= self.max_sessions
+
+    async def create(self, session_id: str, exercise_type: str, output_mode: str = "video") -> InferenceSession:
+        # A new offer from the same client replaces its previous session.
+        await self.close(session_id)
+        if self.is_full():
+            raise SessionLimitError(
+                f"Worker is at capacity ({self.max_sessions} concurrent sessions)."
+            )
+        session = InferenceSession(session_id, exercise_type, output_mode)
+        self._sessions[session_id] = session
+        return session
+
+    async def close(self, session_id: Optional[str], session: Optional[InferenceSession] = None):
+        current = self.get(session_id)
+        if current is None or (session is not None and current is not session):
+            return
+        del self._sessions[session_id]
+        await current.close()
+        if self.on_close is not None:
+            self.on_close(current)
+
+    async def close_all(self):
+        for session_id in list(self._sessions):
+            await self.close(session_id)
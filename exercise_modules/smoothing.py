@@ -0,0 +1,99 @@
+import math
+import os
+from typing import Optional
+
+import numpy as np
+
+from landmarks import VISIBILITY
+
+# One-Euro filter settings for landmark positions. Lower MIN_CUTOFF (Hz) removes
+# more jitter when still, higher BETA lets fast movement through with less lag.
+LANDMARK_SMOOTHING = os.environ.get("LANDMARK_SMOOTHING", "1") == "1"
+SMOOTHING_MIN_CUTOFF = float(os.environ.get("SMOOTHING_MIN_CUTOFF", "1.0"))
+SMOOTHING_BETA = float(os.environ.get("SMOOTHING_BETA", "20.0"))
+SMOOTHING_DERIVATIVE_CUTOFF = 1.0
+# Filter state is dropped after a gap this long (seconds), e.g. when the person leaves the frame
+SMOOTHING_MAX_GAP = 0.5
+# Weight of a landmark's new position is scaled by its visibility, but never below this
+SMOOTHING_MIN_WEIGHT = 0.1
+
+# Consecutive analyzed frames an angle must stay past a threshold before the position changes
+POSITION_CONFIRM_FRAMES = int(os.environ.get("POSITION_CONFIRM_FRAMES", "2"))
+
+
+def _alpha(dt: float, cutoff):
+    return 1.0 / (1.0 + 1.0 / (2.0 * math.pi * cutoff * dt))
+
+
+class LandmarkSmoother:
+    """
+    Streaming One-Euro filter over a (NUM_LANDMARKS, 4) landmark array, one
+    instance per tracked person. Every coordinate of every landmark is
+    filtered at once; landmarks with low visibility move less towards their
+    new, less reliable, position.
+    """
+
+    def __init__(self, min_cutoff: float = SMOOTHING_MIN_CUTOFF, beta: float = SMOOTHING_BETA,
+                 derivative_cutoff: float = SMOOTHING_DERIVATIVE_CUTOFF, max_gap: float = SMOOTHING_MAX_GAP):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self._positions = None
+        self._velocity = None
+        self._time = None
+
+    def __call__(self, landmarks: Optional[np.ndarray], timestamp: float) -> Optional[np.ndarray]:
+        if landmarks is None:
+            return None
+
+        positions = landmarks[:, :VISIBILITY]
+        dt = None if self._time is None else timestamp - self._time
+        if dt is None or dt <= 0 or dt > self.max_gap:
+            self._positions = positions.copy()
+            self._velocity = np.zeros_like(positions)
+            self._time = timestamp
+            return landmarks
+
+        velocity = (positions - self._positions) / dt
+        self._velocity += _alpha(dt, self.derivative_cutoff) * (velocity - self._velocity)
+        alpha = _alpha(dt, self.min_cutoff + self.beta * np.abs(self._velocity))
+        alpha *= np.maximum(landmarks[:, VISIBILITY:], SMOOTHING_MIN_WEIGHT)
+        self._positions += alpha * (positions - self._positions)
+        self._time = timestamp
+
+        smoothed = landmarks.copy()
+        smoothed[:, :VISIBILITY] = self._positions
+        return smoothed
+
+
+# Zones reported by AngleHysteresis
+ABOVE, BELOW = 1, -1
+
+
+class AngleHysteresis:
+    """
+    Debounces an angle against a pair of thresholds. A zone is only reported
+    once the angle has been above `high` (or below `low`) for
+    `confirm_frames` updates in a row; in between it reports None.
+    """
+
+    def __init__(self, high: float, low: float, confirm_frames: int = POSITION_CONFIRM_FRAMES):
+        self.high = high
+        self.low = low
+        self.confirm_frames = max(confirm_frames, 1)
+        self._zone = None
+        self._count = 0
+
+    def update(self, angle: float) -> Optional[int]:
+        zone = ABOVE if angle > self.high else BELOW if angle < self.low else None
+        if zone is None or zone != self._zone:
+            self._zone = zone
+            self._count = 0
+        if zone is None:
+            return None
+        self._count += 1
+        return zone if self._count >= self.confirm_frames else None
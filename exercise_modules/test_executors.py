@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from executors import BatchInferenceExecutor, ThreadPoolInferenceExecutor
+from pose_backends import BACKENDS
+
+
+class BlockingPose:
+    """Estimates nothing, and once `block` is set holds each estimate until the test lets it finish."""
+
+    def __init__(self, **options):
+        self.block = False
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+        self.events = []
+
+    def estimate(self, image):
+        if self.block:
+            self.started.set()
+            self.proceed.wait(5)
+            self.events.append("estimated")
+        return None
+
+    def reset(self):
+        self.events.append("reset")
+
+    def close(self):
+        pass
+
+
+class ReleaseWhileInFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def _cancel_then_release(self, executor):
+        session = SimpleNamespace(session_id="s1", exercise_type="pushup", pose_backend="blocking")
+        await executor.open_session(session)
+        pose = session.pose
+        pose.block = True
+
+        # The session closes while its frame is inside the estimator
+        frame = asyncio.ensure_future(executor.submit(session, np.zeros((64, 64, 3), dtype=np.uint8), 0.0))
+        await asyncio.get_running_loop().run_in_executor(None, pose.started.wait, 5)
+        frame.cancel()
+        executor.release(session)
+        await asyncio.sleep(0.05)
+        self.assertEqual(executor.pose_pool.idle_count(), 0)
+        self.assertEqual(pose.events, [])
+
+        pose.proceed.set()
+        for _ in range(100):
+            if executor.pose_pool.idle_count():
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(executor.pose_pool.idle_count(), 1)
+        self.assertEqual(pose.events, ["estimated", "reset"])
+        self.assertEqual(executor.queue_depth(), 0)
+        with self.assertRaises(asyncio.CancelledError):
+            await frame
+
+    async def test_thread_executor_returns_pose_after_estimate(self):
+        with mock.patch.dict(BACKENDS, {"blocking": BlockingPose}):
+            executor = ThreadPoolInferenceExecutor(workers=2)
+            try:
+                await self._cancel_then_release(executor)
+            finally:
+                executor.shutdown()
+
+    async def test_batch_executor_returns_pose_after_estimate(self):
+        with mock.patch.dict(BACKENDS, {"blocking": BlockingPose}):
+            executor = BatchInferenceExecutor(workers=2)
+            try:
+                await self._cancel_then_release(executor)
+            finally:
+                executor.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+
+from aiortc.mediastreams import MediaStreamError
+
+from frames import LatestFrameReader
+
+
+class QueueTrack:
+    """Hands out whatever the test puts in its queue; None ends the stream."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    async def recv(self):
+        frame = await self.queue.get()
+        if frame is None:
+            raise MediaStreamError
+        return frame
+
+    def stop(self):
+        pass
+
+
+class LatestFrameReaderTest(unittest.IsolatedAsyncioTestCase):
+    async def test_producer_faster_than_consumer(self):
+        track = QueueTrack()
+        reader = LatestFrameReader(track)
+        track.queue.put_nowait("a")
+        self.assertEqual(await reader.recv(), "a")
+
+        # Two frames arrive while the consumer is busy; the newer one is already waiting at the next recv()
+        track.queue.put_nowait("b")
+        track.queue.put_nowait("c")
+        await asyncio.sleep(0.01)
+        self.assertEqual(await reader.recv(), "c")
+        self.assertEqual(reader.dropped, 1)
+
+        # Nothing is waiting now, so recv() has to wait for the next frame instead of ending the stream
+        pending = asyncio.ensure_future(reader.recv())
+        await asyncio.sleep(0.01)
+        self.assertFalse(pending.done())
+        track.queue.put_nowait("d")
+        self.assertEqual(await pending, "d")
+
+        track.queue.put_nowait(None)
+        with self.assertRaises(MediaStreamError):
+            await reader.recv()
+
+
+if __name__ == "__main__":
+    unittest.main()
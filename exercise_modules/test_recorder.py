@@ -0,0 +1,92 @@
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import av
+import numpy as np
+
+from recorder import EVENTS_FILE, TIME_BASE, SessionRecorder
+
+
+def make_frame(index: int) -> av.VideoFrame:
+    frame = av.VideoFrame.from_ndarray(np.zeros((48, 64, 3), dtype=np.uint8), format="rgb24")
+    frame.pts = index * 3000
+    frame.time_base = TIME_BASE
+    return frame
+
+
+class SessionRecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def events(self):
+        with open(self.directory / EVENTS_FILE) as f:
+            return [json.loads(line) for line in f]
+
+    def test_drops_while_the_writer_stalls_are_one_event(self):
+        proceed = threading.Event()
+        add_stream = SessionRecorder._add_stream
+
+        def stalled_add_stream(recorder, *args):
+            proceed.wait(5)
+            return add_stream(recorder, *args)
+
+        with mock.patch.object(SessionRecorder, "_add_stream", stalled_add_stream):
+            recorder = SessionRecorder(self.directory, max_queued_frames=2)
+            self.addCleanup(recorder.close)
+            self.addCleanup(proceed.set)
+            recorder.add_frame(make_frame(0))
+            for _ in range(100):
+                if not recorder._queue:
+                    break
+                threading.Event().wait(0.01)
+            # The writer is stuck on the first frame; two more fit in the queue and the rest are dropped
+            for index in range(1, 11):
+                recorder.add_frame(make_frame(index))
+            self.assertEqual(len(recorder._queue), 2)
+            self.assertEqual(recorder.dropped, 8)
+            proceed.set()
+            recorder.close()
+            recorder._thread.join(5)
+
+        self.assertEqual(recorder.recorded, 3)
+        self.assertEqual([(event["type"], event["count"]) for event in self.events()], [("dropped", 8)])
+
+    def test_failed_writer_takes_no_more_input(self):
+        with mock.patch("recorder.av.open", side_effect=OSError("disk full")):
+            recorder = SessionRecorder(self.directory, max_queued_frames=2)
+            recorder.add_frame(make_frame(0))
+            recorder._thread.join(5)
+        self.assertTrue(recorder.failed)
+        for index in range(1, 50):
+            recorder.add_frame(make_frame(index))
+            recorder.add_event("exercise-change", exerciseType="squat")
+        self.assertEqual(len(recorder._queue), 0)
+        self.assertEqual(recorder.dropped, 0)
+        recorder.close()
+
+    def test_failed_stream_setup_is_logged_and_ends_the_recording(self):
+        with mock.patch.object(SessionRecorder, "_add_stream", side_effect=ValueError("bad codec option")):
+            recorder = SessionRecorder(self.directory)
+            recorder.add_frame(make_frame(0))
+            recorder._thread.join(5)
+        self.assertTrue(recorder.failed)
+        recorder.close()
+
+    def test_mpeg4_fallback_records(self):
+        recorder = SessionRecorder(self.directory, codec="mpeg4")
+        for index in range(5):
+            recorder.add_frame(make_frame(index))
+        recorder.close()
+        recorder._thread.join(5)
+        self.assertFalse(recorder.failed)
+        self.assertEqual(recorder.recorded, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,7 @@ import { useSocket } from "../context/SocketProvider";
 import toast from "react-hot-toast";
 import useAuth from "../hooks/useAuth";
 import PeerService from "../service/peer";
+import { decodeFeedback } from "../service/feedback";
 import useAxiosPrivate from "../hooks/useAxiosPrivate";
 import "./styles/WorkoutStudio.css";
 
@@ -15,6 +16,44 @@ const exercises = [
   { id: "bicepcurl", name: "Bicep Curls" },
 ];
 
+// Same skeleton the server draws in "video" output mode
+const POSE_CONNECTIONS = [
+  [0, 1], [0, 4], [1, 2], [2, 3], [3, 7], [4, 5], [5, 6], [6, 8], [9, 10],
+  [11, 12], [11, 13], [11, 23], [12, 14], [12, 24], [13, 15], [14, 16],
+  [15, 17], [15, 19], [15, 21], [16, 18], [16, 20], [16, 22], [17, 19],
+  [18, 20], [23, 24], [23, 25], [24, 26], [25, 27], [26, 28], [27, 29],
+  [27, 31], [28, 30], [28, 32], [29, 31], [30, 32],
+];
+const VISIBILITY_THRESHOLD = 0.5;
+
+// Landmarks arrive as a flat [x, y, visibility, ...] array in normalized coordinates
+const drawSkeleton = (canvas, landmarks) => {
+  const ctx = canvas.getContext("2d");
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  if (!landmarks) return;
+
+  const point = (i) => [landmarks[i * 3] * canvas.width, landmarks[i * 3 + 1] * canvas.height];
+  const visible = (i) => landmarks[i * 3 + 2] >= VISIBILITY_THRESHOLD;
+
+  ctx.strokeStyle = "rgb(224, 224, 224)";
+  ctx.lineWidth = 2;
+  for (const [start, end] of POSE_CONNECTIONS) {
+    if (!visible(start) || !visible(end)) continue;
+    ctx.beginPath();
+    ctx.moveTo(...point(start));
+    ctx.lineTo(...point(end));
+    ctx.stroke();
+  }
+  ctx.fillStyle = "rgb(255, 0, 0)";
+  for (let i = 0; i < landmarks.length / 3; i++) {
+    if (!visible(i)) continue;
+    ctx.beginPath();
+    ctx.arc(...point(i), 3, 0, 2 * Math.PI);
+    ctx.fill();
+    ctx.stroke();
+  }
+};
+
 const WorkoutStudio = () => {
   const { auth } = useAuth();
   const socket = useSocket();
@@ -22,6 +61,9 @@ const WorkoutStudio = () => {
 
   const webcamRef = useRef(null);
   const remoteVideoRef = useRef(null);
+  const overlayRef = useRef(null);
+  // Highest feedback sequence number applied, so late socket messages cannot undo newer ones
+  const feedbackSeqRef = useRef(0);
 
   // State for WebRTC and UI 
   const [isRecording, setIsRecording] = useState(false);
@@ -29,13 +71,31 @@ const WorkoutStudio = () => {
   const [connectionState, setConnectionState] = useState("disconnected");
   const [error, setError] = useState(null);
   const [showRemoteVideo, setShowRemoteVideo] = useState(true);
+  // "video": the server sends back annotated video. "landmarks": it only sends
+  // landmarks over a data channel and the skeleton is drawn here.
+  const [outputMode, setOutputMode] = useState("video");
+  // The worker recognizes the exercise from the trainee's movement and switches to it
+  const [autoExercise, setAutoExercise] = useState(true);
 
   // State for Workout Data
   const [feedback, setFeedback] = useState(null);
   const [sessionRepCount, setSessionRepCount] = useState(0);
   const [totalReps, setTotalReps] = useState(0);
+  // Per-rep timeline the worker sends when a session ends, saved with the workout
+  const [repEvents, setRepEvents] = useState([]);
   const [startTime, setStartTime] = useState(null);
 
+  // Feedback arrives as deltas: only the fields that changed since the last message
+  const applyFeedback = (packet) => {
+    const message = decodeFeedback(packet);
+    if (message.seq <= feedbackSeqRef.current) return;
+    feedbackSeqRef.current = message.seq;
+    setFeedback((previous) => ({ ...previous, ...message }));
+    if (message.repCount !== undefined) {
+      setSessionRepCount(message.repCount);
+    }
+  };
+
   useEffect(() => {
     if (!socket) return;
 
@@ -47,9 +107,19 @@ const WorkoutStudio = () => {
         await PeerService.peer.addIceCandidate(new RTCIceCandidate(candidate));
       }
     };
-    const handleExerciseFeedback = (data) => {
-      setFeedback(data.feedback);
-      setSessionRepCount(data.repCount);
+    const handleExerciseFeedback = (data) => applyFeedback(data.packet);
+    const handleExerciseRecognized = (data) => setCurrentExercise(data.exerciseType);
+    // The log arrives as columns; the workout stores one object per rep
+    const handleRepLog = ({ startedAt, reps }) => {
+      const events = reps.time.map((time, index) => ({
+        exercise: reps.exercise[index],
+        time: new Date(startedAt * 1000 + time * 1000).toISOString(),
+        duration: reps.duration[index],
+        minAngle: reps.minAngle[index],
+        maxAngle: reps.maxAngle[index],
+        postureFailures: reps.postureFailures[index],
+      }));
+      if (events.length) setRepEvents((previous) => [...previous, ...events]);
     };
     const handlePythonDisconnected = () => {
       setError("AI processing server has disconnected.");
@@ -59,19 +129,29 @@ const WorkoutStudio = () => {
       setError(data.message);
       stopRecording();
     };
+    const handleSessionIdle = ({ idleSeconds, message }) => {
+      setError(message || `Session ended after ${idleSeconds} seconds of inactivity.`);
+      stopRecording();
+    };
 
     socket.on("webrtc-answer", handleWebRtcAnswer);
     socket.on("ice-candidate", handleIceCandidate);
     socket.on("exercise-feedback", handleExerciseFeedback);
+    socket.on("exercise-recognized", handleExerciseRecognized);
+    socket.on("rep-log", handleRepLog);
     socket.on("python-disconnected", handlePythonDisconnected);
     socket.on("error-message", handleErrorMessage);
+    socket.on("session-idle", handleSessionIdle);
 
     return () => {
       socket.off("webrtc-answer", handleWebRtcAnswer);
       socket.off("ice-candidate", handleIceCandidate);
       socket.off("exercise-feedback", handleExerciseFeedback);
+      socket.off("exercise-recognized", handleExerciseRecognized);
+      socket.off("rep-log", handleRepLog);
       socket.off("python-disconnected", handlePythonDisconnected);
       socket.off("error-message", handleErrorMessage);
+      socket.off("session-idle", handleSessionIdle);
     };
   }, [socket]);
 
@@ -81,6 +161,31 @@ const WorkoutStudio = () => {
     }
   }, [currentExercise, isRecording, socket]);
 
+  const setupFeedbackChannel = (peer) => {
+    // Feedback comes straight from the worker instead of through the socket server.
+    // Deltas need every message, so this channel stays reliable and ordered.
+    const channel = peer.createDataChannel("feedback");
+    channel.binaryType = "arraybuffer";
+    channel.onmessage = (event) => applyFeedback(event.data);
+  };
+
+  const setupLandmarkChannel = (peer) => {
+    // Stale landmarks are useless, so the channel never retransmits or reorders
+    const channel = peer.createDataChannel("pose", { ordered: false, maxRetransmits: 0 });
+    channel.onmessage = (event) => {
+      const packet = JSON.parse(event.data);
+      const canvas = overlayRef.current;
+      const video = webcamRef.current;
+      if (canvas && video) {
+        if (canvas.width !== video.videoWidth || canvas.height !== video.videoHeight) {
+          canvas.width = video.videoWidth;
+          canvas.height = video.videoHeight;
+        }
+        drawSkeleton(canvas, packet.landmarks);
+      }
+    };
+  };
+
   const setupPeerListeners = () => {
     PeerService.peer.onicecandidate = (event) => {
       if (event.candidate) {
@@ -105,6 +210,7 @@ const WorkoutStudio = () => {
   const startRecording = async () => {
     setError(null);
     setFeedback(null);
+    feedbackSeqRef.current = 0;
     setIsRecording(true);
     setConnectionState("connecting");
     setSessionRepCount(0);
@@ -120,9 +226,13 @@ const WorkoutStudio = () => {
       webcamRef.current.srcObject = stream;
       const peer = PeerService.init();
       setupPeerListeners(peer);
+      setupFeedbackChannel(peer);
+      if (outputMode === "landmarks") {
+        setupLandmarkChannel(peer);
+      }
       stream.getTracks().forEach((track) => peer.addTrack(track, stream));
       const offer = await PeerService.getOffer();
-      socket.emit("webrtc-offer", { ...offer, exerciseType: currentExercise });
+      socket.emit("webrtc-offer", { ...offer, exerciseType: currentExercise, outputMode, autoExercise });
     } catch (err) {
       setError(`Failed to start session: ${err.message}`);
       setIsRecording(false);
@@ -141,12 +251,14 @@ const WorkoutStudio = () => {
       webcamRef.current.srcObject = null;
     }
     PeerService.cleanup();
+    overlayRef.current?.getContext("2d").clearRect(0, 0, overlayRef.current.width, overlayRef.current.height);
     setConnectionState("disconnected");
   };
 
   const resetWorkout = () => {
     setTotalReps(0);
     setSessionRepCount(0);
+    setRepEvents([]);
     setStartTime(null);
     setFeedback(null);
     setError(null);
@@ -162,6 +274,7 @@ const WorkoutStudio = () => {
       count: totalReps,
       startTime: startTime.toISOString(),
       stopTime: new Date().toISOString(),
+      reps: repEvents,
     };
 
     try {
@@ -176,6 +289,9 @@ const WorkoutStudio = () => {
 
   useEffect(() => () => stopRecording(), []);
 
+  // In landmark mode there is no processed video; the overlay sits on the local camera
+  const showProcessedVideo = showRemoteVideo && outputMode === "video";
+
   if (auth?.user?.userType !== "trainee") {
     return <Navigate to="/access-denied" replace />;
   }
@@ -191,11 +307,27 @@ const WorkoutStudio = () => {
           >
             {exercises.map((ex) => <option key={ex.id} value={ex.id}>{ex.name}</option>)}
           </select>
+          <label htmlFor="output-mode">Overlay:</label>
+          <select
+            className="exercise-select" id="output-mode" value={outputMode}
+            onChange={(e) => setOutputMode(e.target.value)} disabled={isRecording}
+          >
+            <option value="video">Processed video</option>
+            <option value="landmarks">Drawn in browser</option>
+          </select>
+          <label htmlFor="auto-exercise" className="auto-exercise">
+            <input
+              type="checkbox" id="auto-exercise" checked={autoExercise}
+              onChange={(e) => setAutoExercise(e.target.checked)} disabled={isRecording}
+            />
+            Auto-detect
+          </label>
         </div>
 
         <div className="webcam-container">
-          <video ref={webcamRef} autoPlay playsInline muted className="webcam" style={{ display: showRemoteVideo ? "none" : "block" }} />
-          <video ref={remoteVideoRef} autoPlay playsInline className="remote-video" style={{ display: showRemoteVideo ? "block" : "none" }} />
+          <video ref={webcamRef} autoPlay playsInline muted className="webcam" style={{ display: showProcessedVideo ? "none" : "block" }} />
+          <video ref={remoteVideoRef} autoPlay playsInline className="remote-video" style={{ display: showProcessedVideo ? "block" : "none" }} />
+          <canvas ref={overlayRef} className="landmark-overlay" style={{ display: outputMode === "landmarks" && showRemoteVideo ? "block" : "none" }} />
           <div className="diagnostic-overlay"><p>Status: {connectionState}</p></div>
           {error && <div className="error-overlay"><p>{error}</p></div>}
         </div>
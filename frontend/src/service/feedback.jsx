@@ -0,0 +1,37 @@
+// Decoder for the binary feedback messages sent by the Python worker
+// (exercise_modules/feedback.py). Little-endian: uint32 sequence number,
+// uint8 flags, then a uint16 rep count and a uint8 position code if flagged.
+
+const FLAG_KEYFRAME = 1;
+const FLAG_REP_COMPLETED = 2;
+const FLAG_REP_COUNT = 4;
+const FLAG_POSITION = 8;
+
+const POSITIONS = [null, "up", "down", "unknown"];
+
+/**
+ * Decodes one feedback message. Only the fields that changed are present,
+ * except on keyframes, which carry the full state.
+ * @param {ArrayBuffer|ArrayBufferView} packet
+ * @returns {{seq: number, keyframe: boolean, repCompleted: boolean, repCount?: number, position?: string|null}}
+ */
+export const decodeFeedback = (packet) => {
+  const view = ArrayBuffer.isView(packet)
+    ? new DataView(packet.buffer, packet.byteOffset, packet.byteLength)
+    : new DataView(packet);
+  const flags = view.getUint8(4);
+  const message = {
+    seq: view.getUint32(0, true),
+    keyframe: Boolean(flags & FLAG_KEYFRAME),
+    repCompleted: Boolean(flags & FLAG_REP_COMPLETED),
+  };
+  let offset = 5;
+  if (flags & FLAG_REP_COUNT) {
+    message.repCount = view.getUint16(offset, true);
+    offset += 2;
+  }
+  if (flags & FLAG_POSITION) {
+    message.position = POSITIONS[view.getUint8(offset)] ?? "unknown";
+  }
+  return message;
+};